@@ -1,14 +1,31 @@
-from flask import Flask, jsonify, request, session, render_template, redirect, url_for, flash
+from flask import Flask, jsonify, request, session, render_template, redirect, url_for, flash, Response, stream_with_context
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import timedelta, datetime
+from passwords import hash_password, verify_password
+from datetime import timedelta, datetime, date
 from flask_mail import Mail, Message
 import os
-from apscheduler.schedulers.background import BackgroundScheduler
+import time
+import json
+import base64
+import hmac
 from dotenv import load_dotenv
-import atexit
-from models import db, User, Equipment, EquipmentParameter, Unit, Branch
+from models import db, User, Equipment, EquipmentParameter, Unit, Branch, NotificationLedger, due_status, due_status_expression, bump_change_versions, next_service_date_expression, next_service_date, frequency_error, SERVICE_FREQUENCIES, ServiceEvent, record_service_events
+from instrumentation import init_instrumentation, add_collector, render_metrics
+from caching import conditional
+from importer import read_rows, import_equipment, ImportFileError
+from mailer import Email
+from outbox import enqueue as enqueue_email, enqueue_many as enqueue_emails, deliver_outbox, outbox_counts, delivery_latency
+from jobs import run_job, recent_runs
+from refdata import get_reference_data, invalidate as invalidate_reference_data, stats as reference_cache_stats
+from usercache import load_cached_user, invalidate as invalidate_cached_user, stats as user_cache_stats
+from search import match_query, reindex_equipment, include_object as search_include_object
+from fleet import generate_fleet, SIZES as FLEET_SIZES
+from ratelimit import include_object as ratelimit_include_object
+from dbtuning import engine_options, init_db_tuning, pool_sizes
+import click
+from sqlalchemy import and_, or_, func, select, bindparam, insert, update, delete
+from sqlalchemy.orm import aliased
 from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
 from flask_talisman import Talisman
@@ -16,8 +33,6 @@ import logging
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from itsdangerous import URLSafeTimedSerializer
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
 
 
 load_dotenv()
@@ -40,6 +55,8 @@ if uri.startswith("postgres://"):
 
 app.config["SQLALCHEMY_DATABASE_URI"] = uri
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pool sizing, pre-ping, recycling and statement timeout on PostgreSQL (see dbtuning.py)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(uri)
 
 
 app.config['SESSION_COOKIE_SECURE'] = True
@@ -49,8 +66,30 @@ app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 
 app.permanent_session_lifetime = timedelta(minutes=60)
 
+# Days before an unchanged due/overdue item is mentioned to its HOU again (0 = never).
+app.config['NOTIFICATION_REMINDER_DAYS'] = int(os.environ.get('NOTIFICATION_REMINDER_DAYS', 7))
+# Seconds a worker trusts its cached branches/units before checking for changes made elsewhere
+app.config['REFERENCE_CACHE_TTL'] = int(os.environ.get('REFERENCE_CACHE_TTL', 60))
+# Seconds (and entries) the user loader keeps a logged-in user without querying it again
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 30))
+app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 1024))
+# Set to let a Prometheus scraper read /metrics with "Authorization: Bearer <token>" instead of an admin session
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+app.config['SERVER_TIMING'] = os.environ.get('SERVER_TIMING', '1') != '0'
+# Rate-limit counters shared by all workers (see ratelimit.py). SQLite deployments keep them in their own file;
+# set RATELIMIT_STORAGE_URI=memory:// for per-process counters.
+default_ratelimit_uri = ("sql+" + uri if uri.startswith("postgresql")
+                         else f"sql+sqlite:///{os.path.join(instance_path, 'ratelimit.db')}")
+app.config['RATELIMIT_STORAGE_URI'] = os.environ.get('RATELIMIT_STORAGE_URI', default_ratelimit_uri)
+# Keep limiting per process if the shared storage is unreachable
+app.config['RATELIMIT_IN_MEMORY_FALLBACK_ENABLED'] = True
+# The limiter's own engine gets as many connections as the app pool keeps open
+app.config['RATELIMIT_STORAGE_OPTIONS'] = {'pool_size': pool_sizes()[0], 'max_overflow': 0}
+
 db.init_app(app)
-migrate = Migrate(app, db)
+init_db_tuning(app, db)
+migrate = Migrate(app, db, include_object=lambda *args: search_include_object(*args) and ratelimit_include_object(*args))
+init_instrumentation(app, db)
 
 csp = {
     'default-src': "'self'",
@@ -78,7 +117,7 @@ def make_session_permanent():
 
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    return load_cached_user(int(user_id))
 
 @app.context_processor
 def inject_user():
@@ -91,7 +130,8 @@ def home():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    return render_template('dashboard.html')
+    reference = get_reference_data()
+    return render_template('dashboard.html', branches=reference.branches, units=reference.units)
 
 @app.route('/api/user')
 @login_required
@@ -107,9 +147,8 @@ def get_current_user():
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
-    units = Unit.query.all()
-    branches = Branch.query.all()
-    return render_template('register.html', units=units, branches=branches)
+    reference = get_reference_data()
+    return render_template('register.html', units=reference.units, branches=reference.branches)
 
 @app.route('/api/register', methods=['POST'])
 @limiter.limit("5 per minute")
@@ -142,11 +181,12 @@ def api_register():
         if errors:
             return jsonify({"errors": errors}), 400
 
-        if User.query.filter_by(username=username).first() or User.query.filter_by(email=email).first():
+        if User.login_taken(username, email):
             return jsonify({"error": "Username or email already exists"}), 400
 
-        hashed_password = generate_password_hash(password_hash)
-        if User.query.count() == 0:
+        hashed_password = hash_password(password_hash)
+        # The very first account becomes the admin
+        if not db.session.execute(select(select(User.id).exists())).scalar():
             new_user = User(username=username, email=email, unit_id=unit_id, password_hash=hashed_password, roles='admin')
         else:
             new_user = User(username=username, email=email, unit_id=unit_id, password_hash=hashed_password, roles='user')
@@ -163,16 +203,22 @@ def login():
 @limiter.limit("5 per minute")
 def api_login():
     if request.method == 'POST':
-        data = request.json
-        username = data.get('login')
-        password = data.get('password')
+        data = request.get_json(silent=True)
+        username = data.get('login') if isinstance(data, dict) else None
+        password = data.get('password') if isinstance(data, dict) else None
 
-        if username:
-            user = User.query.filter_by(username=username).first() or User.query.filter_by(email=username).first()
-        else:
+        if not isinstance(username, str) or not username.strip():
             return jsonify({"error": "Username or email required"}), 400
-        
-        if user and check_password_hash(user.password_hash, password):
+        if not isinstance(password, str) or not password:
+            return jsonify({"error": "Password required"}), 400
+        user = User.find_by_login(username)
+
+        # Unknown accounts still pay for one hash check, so every attempt costs the same
+        if user is None:
+            verify_password(None, password)
+        elif user.check_password(password):
+            if db.session.is_modified(user):
+                db.session.commit()  # the hash was upgraded to the current PASSWORD_HASH_METHOD
             login_user(user)
             return jsonify({"message": "Login successful"}), 200
         return jsonify({"error": "Invalid username or password"}), 401
@@ -242,6 +288,7 @@ def setup_branch():
             new_unit = Unit(name=unit_name, branch_id=target_branch_id)
             db.session.add(new_unit)
             db.session.commit()
+            invalidate_reference_data()
             
             # Move success message to after the commit
             if existing_branch_id:
@@ -256,11 +303,11 @@ def setup_branch():
             
         return redirect(url_for('setup_branch'))
     
-    branches = Branch.query.order_by(Branch.name).all()
-    return render_template('setup.html', branches=branches)
+    return render_template('setup.html', branches=get_reference_data().branches)
 
 @app.route('/api/admin/users', methods=['GET'])
 @login_required
+@conditional('user')
 def get_users():
     users = User.query.all()
     return jsonify([{
@@ -290,14 +337,304 @@ def delete_user(user_id):
 
     db.session.delete(user)
     db.session.commit()
+    invalidate_cached_user(user_id)
+    # The user may have been a unit's HOU.
+    invalidate_reference_data()
     return jsonify({"message": "User deleted"}), 200
 
+EQUIPMENT_PAGE_SIZE = 50
+EQUIPMENT_MAX_PAGE_SIZE = 200
+
+# Sortable columns for the paginated equipment list. Nullable columns are
+# sorted through a coalesce so the keyset comparison never meets a NULL;
+# NOT NULL columns sort on the bare column so (name, id) can use its index.
+EQUIPMENT_SORT_FIELDS = {
+    'name': (Equipment.name, None),
+    'new_id_number': (Equipment.new_id_number, ''),
+    'serial_number': (Equipment.serial_number, ''),
+    'next_calibration_date': (Equipment.next_calibration_date, date.max),
+    'next_maintenance_date': (Equipment.next_maintenance_date, date.max),
+    'created_at': (Equipment.created_at, datetime.min),
+    'id': (Equipment.id, None),
+}
+
+def encode_cursor(value, last_id):
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    payload = json.dumps({"v": value, "id": last_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, value_type):
+    """(value, id) from encode_cursor(); raises ValueError/TypeError unless value is a `value_type`."""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    value, last_id = payload['v'], payload['id']
+    if value_type in (date, datetime):
+        value = value_type.fromisoformat(value)
+    elif not isinstance(value, value_type) or isinstance(value, bool):
+        raise TypeError(f"cursor value must be {value_type.__name__}")
+    if not isinstance(last_id, int) or isinstance(last_id, bool):
+        raise TypeError("cursor id must be int")
+    return value, last_id
+
+def paginated_equipments():
+    args = request.args
+    errors = {}
+
+    try:
+        limit = int(args.get('limit', EQUIPMENT_PAGE_SIZE))
+        if limit < 1:
+            raise ValueError
+        limit = min(limit, EQUIPMENT_MAX_PAGE_SIZE)
+    except ValueError:
+        errors['limit'] = 'Limit must be a positive number.'
+
+    search = (args.get('q') or '').strip()
+    # Searches come back best match first unless another order is asked for.
+    sort = args.get('sort', 'relevance' if search else 'name')
+    if sort not in EQUIPMENT_SORT_FIELDS and not (sort == 'relevance' and search):
+        errors['sort'] = f"Cannot sort by '{sort}'."
+
+    order = args.get('order', 'asc').lower()
+    if order not in ('asc', 'desc'):
+        errors['order'] = "Order must be 'asc' or 'desc'."
+
+    if errors:
+        return jsonify({"message": "Validation failed", "errors": errors}), 400
+
+    query = Equipment.query
+    filters = []
+
+    branch_id = args.get('branch_id', type=int)
+    if branch_id:
+        query = query.join(Unit, Equipment.unit_id == Unit.id)
+        filters.append(Unit.branch_id == branch_id)
+
+    unit_id = args.get('unit_id', type=int)
+    if unit_id:
+        filters.append(Equipment.unit_id == unit_id)
+
+    for param, status_is in (('cal_status', Equipment.cal_status_is),
+                             ('mnt_status', Equipment.mnt_status_is)):
+        status = args.get(param)
+        if status and status != 'all':
+            condition = status_is(status)
+            if condition is None:
+                return jsonify({"message": "Validation failed", "errors": {param: f"Unknown status '{status}'."}}), 400
+            filters.append(condition)
+
+    matches = match_query(search) if search else None
+    if matches is not None:
+        query = query.join(matches, matches.c.equipment_id == Equipment.id)
+    elif search:
+        # No full-text index on this database: substring match instead, unranked.
+        pattern = f"%{search}%"
+        filters.append(or_(
+            Equipment.name.ilike(pattern),
+            Equipment.new_id_number.ilike(pattern),
+            Equipment.serial_number.ilike(pattern),
+            Equipment.manufacturer.ilike(pattern),
+            Equipment.model.ilike(pattern),
+        ))
+        if sort == 'relevance':
+            sort = 'name'
+
+    query = query.filter(*filters)
+
+    # The total is only computed for the first page; later pages reuse the client's copy.
+    cursor = args.get('cursor')
+    total = None if cursor else query.order_by(None).count()
+
+    if sort == 'relevance':
+        return ranked_equipment_page(query, matches, cursor, limit, total)
+
+    column, sentinel = EQUIPMENT_SORT_FIELDS[sort]
+    sort_expr = func.coalesce(column, sentinel) if sentinel is not None else column
+
+    if cursor:
+        try:
+            last_value, last_id = decode_cursor(cursor, column.type.python_type)
+        except (ValueError, KeyError, TypeError):
+            return jsonify({"message": "Validation failed", "errors": {"cursor": "Invalid cursor."}}), 400
+        if sort == 'id':
+            query = query.filter(Equipment.id < last_id if order == 'desc' else Equipment.id > last_id)
+        elif order == 'desc':
+            query = query.filter(or_(sort_expr < last_value, and_(sort_expr == last_value, Equipment.id < last_id)))
+        else:
+            query = query.filter(or_(sort_expr > last_value, and_(sort_expr == last_value, Equipment.id > last_id)))
+
+    if order == 'desc':
+        query = query.order_by(sort_expr.desc(), Equipment.id.desc())
+    else:
+        query = query.order_by(sort_expr.asc(), Equipment.id.asc())
+
+    # Fetch one extra row to know whether another page exists.
+    rows = query.options(*Equipment.serialization_options()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        last_value = getattr(last, column.key)
+        if last_value is None:
+            last_value = sentinel
+        next_cursor = encode_cursor(last_value, last.id)
+
+    return jsonify({
+        "items": [eq.to_dict() for eq in rows],
+        "next_cursor": next_cursor,
+        "has_more": has_more,
+        "total": total,
+        "limit": limit,
+    })
+
+def ranked_equipment_page(query, matches, cursor, limit, total):
+    # Ranks are not stable keys, so ranked results are paged by offset; searches
+    # are read from the top, which keeps the offsets small.
+    offset = 0
+    if cursor:
+        try:
+            offset, _ = decode_cursor(cursor, int)
+            if offset < 0:
+                raise ValueError
+        except (ValueError, KeyError, TypeError):
+            return jsonify({"message": "Validation failed", "errors": {"cursor": "Invalid cursor."}}), 400
+
+    rows = (query.order_by(matches.c.rank.desc(), Equipment.id.asc())
+            .options(*Equipment.serialization_options())
+            .offset(offset).limit(limit + 1).all())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return jsonify({
+        "items": [eq.to_dict() for eq in rows],
+        "next_cursor": encode_cursor(offset + limit, 0) if has_more else None,
+        "has_more": has_more,
+        "total": total,
+        "limit": limit,
+    })
+
 @app.route('/api/equipments', methods=['GET'])
 @login_required
+@conditional('equipment', 'equipment_parameter', 'unit', 'branch')
 def get_equipments():
-    equipments = Equipment.query.all()
+    # Any paging/filter argument switches to the paginated response shape.
+    if request.args:
+        return paginated_equipments()
+    equipments = Equipment.query.options(*Equipment.serialization_options()).all()
     return jsonify([eq.to_dict() for eq in equipments])
 
+SUMMARY_STATUSES = ('OK', 'Due Soon', 'Over Due', 'Unknown')
+
+def empty_status_counts():
+    return {
+        "calibration": dict.fromkeys(SUMMARY_STATUSES, 0),
+        "maintenance": dict.fromkeys(SUMMARY_STATUSES, 0),
+        "total": 0,
+    }
+
+@app.route('/api/summary', methods=['GET'])
+@login_required
+@conditional('equipment', 'unit', 'branch', 'user')
+def get_summary():
+    # Each count is a GROUP BY over (unit_id, date) that the composite
+    # unit/date indexes answer without reading the equipment rows.
+    per_unit = {}
+    for service_type, column in (('calibration', Equipment.next_calibration_date),
+                                 ('maintenance', Equipment.next_maintenance_date)):
+        # Grouped through a subquery so PostgreSQL does not see the CASE (and
+        # its date parameters) twice and reject it as ungrouped.
+        statuses = select(Equipment.unit_id, due_status_expression(column, 'Unknown').label('status')).subquery()
+        rows = db.session.execute(
+            select(statuses.c.unit_id, statuses.c.status, func.count())
+            .group_by(statuses.c.unit_id, statuses.c.status)
+        )
+        for unit_id, label, count in rows:
+            counts = per_unit.setdefault(unit_id, empty_status_counts())
+            counts[service_type][label] += count
+            if service_type == 'calibration':
+                counts["total"] += count
+
+    reference = get_reference_data()
+    overall = empty_status_counts()
+    by_branch = {branch.id: {"branch_id": branch.id, "branch_name": branch.name, **empty_status_counts()}
+                 for branch in reference.branches}
+    by_unit = []
+    for unit_id, counts in per_unit.items():
+        unit = reference.unit(unit_id)
+        by_unit.append({
+            "unit_id": unit_id,
+            "unit_name": unit.name if unit else None,
+            "branch_id": unit.branch_id if unit else None,
+            **counts,
+        })
+        targets = [overall]
+        if unit and unit.branch_id in by_branch:
+            targets.append(by_branch[unit.branch_id])
+        for target in targets:
+            target["total"] += counts["total"]
+            for service_type in ('calibration', 'maintenance'):
+                for label, count in counts[service_type].items():
+                    target[service_type][label] += count
+
+    role_counts = dict(db.session.execute(select(User.roles, func.count()).group_by(User.roles)).all())
+    return jsonify({
+        **overall,
+        "by_branch": list(by_branch.values()),
+        "by_unit": sorted(by_unit, key=lambda unit: (unit["unit_name"] or '', unit["unit_id"])),
+        "users": {role: role_counts.get(role, 0) for role in ('admin', 'hou', 'user')},
+    })
+
+EXPORT_BATCH_SIZE = 1000
+
+@app.route('/api/equipments/export', methods=['GET'])
+@login_required
+def export_equipments():
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'json'):
+        return jsonify({"error": "Format must be 'ndjson' or 'json'."}), 400
+
+    def generate():
+        # yield_per streams rows from a server-side cursor (where the driver has one)
+        # in batches, and each batch is expunged once written, so memory stays flat.
+        query = (select(Equipment)
+                 .options(*Equipment.serialization_options())
+                 .order_by(Equipment.id)
+                 .execution_options(yield_per=EXPORT_BATCH_SIZE))
+        result = db.session.execute(query).scalars()
+
+        if export_format == 'json':
+            yield '['
+        separator = ''
+        for batch in result.partitions():
+            rows = [json.dumps(eq.to_dict()) for eq in batch]
+            if export_format == 'json':
+                chunk = separator + ','.join(rows)
+                separator = ','
+            else:
+                chunk = '\n'.join(rows) + '\n'
+            for eq in batch:
+                for param in eq.parameters:
+                    db.session.expunge(param)
+                db.session.expunge(eq)
+            yield chunk
+        if export_format == 'json':
+            yield ']'
+
+    mimetype = 'application/json' if export_format == 'json' else 'application/x-ndjson'
+    filename = f"equipment-{datetime.utcnow().date()}.{'json' if export_format == 'json' else 'ndjson'}"
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+def serialize_equipment(equipment_id):
+    """Reloads a just-committed equipment with its relations eagerly and returns to_dict()."""
+    equipment = Equipment.query.options(*Equipment.serialization_options()).filter_by(id=equipment_id).one()
+    return equipment.to_dict()
+
 @app.route('/equipments/<int:equipment_id>', methods=['GET'])
 @login_required
 def equipment_page(equipment_id):
@@ -360,6 +697,11 @@ def add_equipment():
             errors['maintenance_date'] = 'Invalid date format. Please use YYYY-MM-DD.'
     else:
         errors['maintenance_date'] = 'Maintenance date is required.'
+
+    for field in ('calibration_frequency', 'maintenance_frequency'):
+        message = frequency_error(data.get(field))
+        if message:
+            errors[field] = message
         
     try:
         quantity = int(quantity)
@@ -405,22 +747,146 @@ def add_equipment():
                 db.session.add(new_parameter)
 
     db.session.commit()
-    return jsonify(new_equipment.to_dict()), 201
+    return jsonify(serialize_equipment(new_equipment.id)), 201
+
+@app.route('/api/equipments/import', methods=['POST'])
+@login_required
+def import_equipments():
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({"error": "A .csv or .xlsx file is required"}), 400
+
+    try:
+        records = read_rows(upload.stream, upload.filename)
+    except ImportFileError as e:
+        return jsonify({"error": str(e)}), 400
+
+    dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    report = import_equipment(records, dry_run=dry_run, actor=current_user)
+    status = 201 if report["created"] else 200
+    return jsonify(report), status
+
+@app.cli.command('import-equipment')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--dry-run', is_flag=True, help="Validate the file without inserting anything.")
+def import_equipment_command(path, dry_run):
+    """Bulk-import equipment from a CSV or XLSX file."""
+    with open(path, 'rb') as stream:
+        try:
+            records = read_rows(stream, path)
+        except ImportFileError as e:
+            raise click.ClickException(str(e))
+        report = import_equipment(records, dry_run=dry_run)
+
+    for error in report["errors"]:
+        details = "; ".join(f"{field}: {message}" for field, message in error["errors"].items())
+        click.echo(f"Row {error['row']}: {details}")
+    if dry_run:
+        click.echo(f"Dry run: {report['total'] - report['failed']} of {report['total']} rows are valid.")
+    else:
+        click.echo(f"Created {report['created']} of {report['total']} rows; {report['failed']} failed.")
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the full-text search index from the equipment table."""
+    started = time.perf_counter()
+    reindex_equipment(db.session.connection())
+    db.session.commit()
+    click.echo(f"Indexed {Equipment.query.count()} equipment in {time.perf_counter() - started:.2f}s.")
+
+@app.cli.command('generate-fleet')
+@click.option('--size', type=click.Choice(sorted(FLEET_SIZES)), help="Preset equipment count.")
+@click.option('--equipment', type=int, help="Exact equipment count (overrides --size).")
+@click.option('--branches', default=10, show_default=True)
+@click.option('--units-per-branch', default=6, show_default=True)
+@click.option('--users-per-unit', default=4, show_default=True)
+@click.option('--password', default='password', show_default=True, help="Password of every generated user.")
+@click.option('--seed', default=42, show_default=True)
+def generate_fleet_command(size, equipment, branches, units_per_branch, users_per_unit, password, seed):
+    """Add a synthetic fleet (branches, units, users, equipment, parameters) for load testing."""
+    equipment_count = equipment if equipment is not None else FLEET_SIZES[size or '1k']
+    started = time.perf_counter()
+
+    def progress(done, total):
+        click.echo(f"  {done}/{total} equipment ({time.perf_counter() - started:.1f}s)")
+
+    report = generate_fleet(equipment_count, branches=branches, units_per_branch=units_per_branch,
+                            users_per_unit=users_per_unit, password=password, seed=seed, progress=progress)
+    click.echo(f"Generated fleet '{report['tag']}': {report['branches']} branches, {report['units']} units, "
+               f"{report['users']} users, {report['equipment']} equipment, {report['parameters']} parameters "
+               f"in {time.perf_counter() - started:.1f}s.")
+
+RECOMPUTE_CHUNK_SIZE = 1000
+
+def recompute_next_service_dates(chunk_size=RECOMPUTE_CHUNK_SIZE, dry_run=False):
+    """Rewrites every next_calibration_date/next_maintenance_date from the frequency registry.
+
+    Walks the table in id order, one chunk per transaction, and writes only the
+    rows whose dates change, with one executemany UPDATE per chunk.
+    Returns (rows scanned, rows changed).
+    """
+    equipment = Equipment.__table__
+    statement = (
+        equipment.update()
+        .where(equipment.c.id == bindparam('b_id'))
+        .values(next_calibration_date=bindparam('b_next_calibration_date'),
+                next_maintenance_date=bindparam('b_next_maintenance_date'))
+    )
+    scanned = changed = last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(equipment.c.id,
+                   equipment.c.calibration_date, equipment.c.calibration_frequency, equipment.c.next_calibration_date,
+                   equipment.c.maintenance_date, equipment.c.maintenance_frequency, equipment.c.next_maintenance_date)
+            .where(equipment.c.id > last_id)
+            .order_by(equipment.c.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+
+        updates = []
+        for row in rows:
+            next_calibration = next_service_date(row.calibration_date, row.calibration_frequency)
+            next_maintenance = next_service_date(row.maintenance_date, row.maintenance_frequency)
+            if (next_calibration, next_maintenance) != (row.next_calibration_date, row.next_maintenance_date):
+                updates.append({"b_id": row.id, "b_next_calibration_date": next_calibration,
+                                "b_next_maintenance_date": next_maintenance})
+
+        if updates and not dry_run:
+            db.session.execute(statement, updates)
+            bump_change_versions(db.session.connection(), ['equipment'])
+            db.session.commit()
+        scanned += len(rows)
+        changed += len(updates)
+        last_id = rows[-1].id
+
+    db.session.rollback()
+    return scanned, changed
+
+@app.cli.command('recompute-due-dates')
+@click.option('--chunk-size', default=RECOMPUTE_CHUNK_SIZE, show_default=True, help="Rows read and written per transaction.")
+@click.option('--dry-run', is_flag=True, help="Count the rows that would change without writing them.")
+def recompute_due_dates_command(chunk_size, dry_run):
+    """Recompute next calibration/maintenance dates after a frequency policy change."""
+    started = time.perf_counter()
+    scanned, changed = recompute_next_service_dates(chunk_size, dry_run=dry_run)
+    verb = "would change" if dry_run else "changed"
+    click.echo(f"Scanned {scanned} equipment; {changed} {verb} in {time.perf_counter() - started:.2f}s.")
 
 @app.route('/addEquipment', methods=['GET', 'POST'])
 @login_required
 def add_equipment_page():
-    branches = Branch.query.order_by(Branch.name).all()
-    units = Unit.query.order_by(Unit.name).all()
-    return render_template('addEquipment.html', branches=branches, units=units)
+    reference = get_reference_data()
+    return render_template('addEquipment.html', branches=reference.branches, units=reference.units)
 
 @app.route('/updateEquipment/<int:equipment_id>', methods=['GET'])
 @login_required
 def update_equipment_page(equipment_id):
     equipment = Equipment.query.get_or_404(equipment_id)
-    branches = Branch.query.order_by(Branch.name).all()
-    units = Unit.query.order_by(Unit.name).all()
-    return render_template('updateEquipment.html', equipment=equipment, branches=branches, units=units)
+    reference = get_reference_data()
+    return render_template('updateEquipment.html', equipment=equipment, branches=reference.branches, units=reference.units,
+                           frequencies=SERVICE_FREQUENCIES)
 
 @app.route('/api/updateEquipment/<int:equipment_id>', methods=['PUT'])
 @login_required
@@ -469,6 +935,11 @@ def update_equipment(equipment_id):
         except ValueError:
             errors['maintenance_date'] = 'Invalid date format. Please use YYYY-MM-DD.'
 
+    for field in ('calibration_frequency', 'maintenance_frequency'):
+        message = frequency_error(data.get(field))
+        if message:
+            errors[field] = message
+
     if quantity is not None:
         try:
             quantity = int(quantity)
@@ -498,20 +969,67 @@ def update_equipment(equipment_id):
     if maintenance_date:
         equipment.maintenance_date = maintenance_date
 
-    # Delete old parameters and add new ones
-    EquipmentParameter.query.filter_by(equipment_id=equipment.id).delete()
-    new_parameters = data.get('parameters', [])
-    if new_parameters:
-        for param in new_parameters:
-            if param.get('name') and param.get('value'):
-                db.session.add(EquipmentParameter(
-                    equipment_id=equipment.id,
-                    parameter_name=param['name'].strip(),
-                    parameter_value=param['value'].strip()
-                ))
+    # Only touch the parameters that actually changed
+    submitted = [
+        (param['name'].strip(), param['value'].strip())
+        for param in data.get('parameters', [])
+        if param.get('name') and param.get('value')
+    ]
+    parameter_changes = apply_parameter_changes(equipment.id, submitted)
 
     db.session.commit()
-    return jsonify(equipment.to_dict())
+    return jsonify({**serialize_equipment(equipment.id), "parameter_changes": parameter_changes})
+
+def diff_parameters(existing, submitted):
+    """Works out how to turn `existing` (id, name, value) rows into the `submitted` (name, value) pairs.
+
+    Unchanged pairs keep their rows and a changed value reuses a row with the
+    same name. Returns (inserts, updates, delete_ids).
+    """
+    unmatched = list(existing)
+    pending = []
+    for name, value in submitted:
+        same = next((row for row in unmatched if row[1] == name and row[2] == value), None)
+        if same:
+            unmatched.remove(same)
+        else:
+            pending.append((name, value))
+
+    inserts, updates = [], []
+    for name, value in pending:
+        same_name = next((row for row in unmatched if row[1] == name), None)
+        if same_name:
+            unmatched.remove(same_name)
+            updates.append({"id": same_name[0], "parameter_value": value})
+        else:
+            inserts.append((name, value))
+    return inserts, updates, [row[0] for row in unmatched]
+
+def apply_parameter_changes(equipment_id, submitted):
+    """Brings an equipment's parameters in line with `submitted` using at most one statement per kind of change."""
+    existing = db.session.execute(
+        select(EquipmentParameter.id, EquipmentParameter.parameter_name, EquipmentParameter.parameter_value)
+        .where(EquipmentParameter.equipment_id == equipment_id)
+        .order_by(EquipmentParameter.id)
+    ).all()
+    inserts, updates, delete_ids = diff_parameters(existing, submitted)
+
+    if delete_ids:
+        db.session.execute(delete(EquipmentParameter).where(EquipmentParameter.id.in_(delete_ids)))
+    if updates:
+        db.session.execute(update(EquipmentParameter), updates)
+    if inserts:
+        db.session.execute(insert(EquipmentParameter), [
+            {"equipment_id": equipment_id, "parameter_name": name, "parameter_value": value}
+            for name, value in inserts
+        ])
+    if inserts or updates or delete_ids:
+        # Bulk statements skip the flush events behind ETags and the search index.
+        connection = db.session.connection()
+        bump_change_versions(connection, ['equipment_parameter'])
+        reindex_equipment(connection, [equipment_id])
+
+    return {"added": len(inserts), "updated": len(updates), "removed": len(delete_ids)}
 
 @app.route('/api/delete/<int:equipment_id>', methods=['DELETE'])
 @login_required
@@ -520,6 +1038,7 @@ def delete_equipment(equipment_id):
     equipmentParams = EquipmentParameter.query.filter_by(equipment_id=equipment.id).all()
     for param in equipmentParams:
         db.session.delete(param)
+    NotificationLedger.query.filter_by(equipment_id=equipment.id).delete()
     db.session.delete(equipment)
     db.session.commit()
     return jsonify({"message": "Equipment deleted"}), 200
@@ -533,8 +1052,10 @@ def calibrate_equipment(equipment_id):
     if calibration_date:
         equipment.calibration_date = datetime.strptime(calibration_date, "%Y-%m-%d").date()
         equipment.set_next_calibration_date()
+        record_service_events(db.session.connection(), [equipment.id], 'calibration',
+                              equipment.calibration_date, current_user, source='single')
         db.session.commit()
-        return jsonify(equipment.to_dict()), 200
+        return jsonify(serialize_equipment(equipment.id)), 200
     return jsonify({"error": "Calibration date is required"}), 400
 
 @app.route('/api/maintain/<int:equipment_id>', methods=['PUT'])
@@ -546,10 +1067,177 @@ def maintain_equipment(equipment_id):
     if maintenance_date:
         equipment.maintenance_date = datetime.strptime(maintenance_date, "%Y-%m-%d").date()
         equipment.set_next_maintenance_date()
+        record_service_events(db.session.connection(), [equipment.id], 'maintenance',
+                              equipment.maintenance_date, current_user, source='single')
         db.session.commit()
-        return jsonify(equipment.to_dict()), 200
+        return jsonify(serialize_equipment(equipment.id)), 200
     return jsonify({"error": "Maintenance date is required"}), 400
 
+BULK_SERVICE_MAX_IDS = 1000
+
+def record_bulk_service(service_type):
+    """Marks many equipment as calibrated/maintained on one date with a single UPDATE."""
+    data = request.get_json(silent=True) or {}
+    errors = {}
+
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+        errors['ids'] = 'A list of equipment IDs is required.'
+    elif len(ids) > BULK_SERVICE_MAX_IDS:
+        errors['ids'] = f'At most {BULK_SERVICE_MAX_IDS} equipment can be updated at once.'
+
+    service_date = datetime.now().date()
+    if data.get('date'):
+        try:
+            service_date = datetime.strptime(data['date'], "%Y-%m-%d").date()
+            if service_date > datetime.now().date():
+                errors['date'] = 'The service date cannot be in the future.'
+        except (ValueError, TypeError):
+            errors['date'] = 'Invalid date format. Please use YYYY-MM-DD.'
+
+    if errors:
+        return jsonify({"message": "Validation failed", "errors": errors}), 400
+
+    if service_type == 'calibration':
+        date_column, next_column, frequency_column = (
+            Equipment.calibration_date, Equipment.next_calibration_date, Equipment.calibration_frequency)
+    else:
+        date_column, next_column, frequency_column = (
+            Equipment.maintenance_date, Equipment.next_maintenance_date, Equipment.maintenance_frequency)
+
+    # The next date only depends on the frequency, so one CASE over the
+    # frequencies in use covers every row and the batch is a single UPDATE ... RETURNING.
+    frequencies = db.session.execute(
+        select(frequency_column).where(Equipment.id.in_(set(ids))).distinct()
+    ).scalars().all()
+    # A late entry for an older service must not move the dates of a newer one backwards.
+    updated = db.session.execute(
+        update(Equipment)
+        .where(Equipment.id.in_(set(ids)), or_(date_column.is_(None), date_column < service_date))
+        .values({
+            date_column: service_date,
+            next_column: next_service_date_expression(frequency_column, service_date, frequencies),
+        })
+        .returning(Equipment.id, next_column)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if updated:
+        # Bulk UPDATEs skip the flush event that bumps the ETag versions.
+        bump_change_versions(db.session.connection(), ['equipment'])
+        record_service_events(db.session.connection(), [row[0] for row in updated], service_type,
+                              service_date, current_user, source='bulk')
+    db.session.commit()
+
+    next_dates = dict(updated)
+    # Rows left out were either not found or already serviced on or after service_date.
+    not_updated = set(ids) - set(next_dates)
+    newer_dates = dict(db.session.execute(
+        select(Equipment.id, date_column).where(Equipment.id.in_(not_updated))
+    ).all()) if not_updated else {}
+    unknown = 'Unknown C' if service_type == 'calibration' else 'Unknown M'
+    results = []
+    for equipment_id in dict.fromkeys(ids):
+        if equipment_id in next_dates:
+            next_date = next_dates[equipment_id]
+            results.append({
+                "id": equipment_id,
+                "ok": True,
+                f"next_{service_type}_date": str(next_date) if next_date else None,
+                "status": due_status(next_date, unknown),
+            })
+        elif equipment_id in newer_dates:
+            results.append({"id": equipment_id, "ok": False,
+                            "error": f"A {service_type} on {newer_dates[equipment_id]} is already recorded."})
+        else:
+            results.append({"id": equipment_id, "ok": False, "error": "Equipment not found."})
+
+    return jsonify({
+        "service_type": service_type,
+        "date": str(service_date),
+        "updated": len(updated),
+        "results": results,
+    }), 200
+
+@app.route('/api/calibrate', methods=['PUT'])
+@login_required
+def bulk_calibrate_equipment():
+    return record_bulk_service('calibration')
+
+@app.route('/api/maintain', methods=['PUT'])
+@login_required
+def bulk_maintain_equipment():
+    return record_bulk_service('maintenance')
+
+SERVICE_PERIODS = ('week', 'month', 'quarter', 'year')
+
+def service_period(day, period):
+    """Label of the period `day` falls in: '2026-W07', '2026-02', '2026-Q1' or '2026'."""
+    if period == 'week':
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    if period == 'month':
+        return f"{day.year}-{day.month:02d}"
+    if period == 'quarter':
+        return f"{day.year}-Q{(day.month - 1) // 3 + 1}"
+    return str(day.year)
+
+def parse_date_arg(name, default):
+    value = request.args.get(name)
+    return datetime.strptime(value, "%Y-%m-%d").date() if value else default
+
+@app.route('/api/service-events/throughput', methods=['GET'])
+@login_required
+def service_throughput():
+    """Calibrations and maintenances per period, optionally for one branch or unit."""
+    period = request.args.get('period', 'month')
+    if period not in SERVICE_PERIODS:
+        return jsonify({"message": "Validation failed", "errors": {"period": f"Period must be one of {', '.join(SERVICE_PERIODS)}."}}), 400
+    try:
+        date_to = parse_date_arg('to', datetime.now().date())
+        date_from = parse_date_arg('from', date_to - timedelta(days=365))
+    except ValueError:
+        return jsonify({"message": "Validation failed", "errors": {"date": "Invalid date format. Please use YYYY-MM-DD."}}), 400
+    if date_from > date_to:
+        return jsonify({"message": "Validation failed", "errors": {"date": "The 'from' date must not be after the 'to' date."}}), 400
+
+    # Counted per day in SQL as a range scan on the (branch_id, service_date) or
+    # (service_date, kind) index, then bucketed here so weeks and quarters work
+    # the same on every database.
+    query = (select(ServiceEvent.service_date, ServiceEvent.kind, func.count())
+             .where(ServiceEvent.service_date.between(date_from, date_to))
+             .group_by(ServiceEvent.service_date, ServiceEvent.kind))
+    branch_id = request.args.get('branch_id', type=int)
+    if branch_id:
+        query = query.where(ServiceEvent.branch_id == branch_id)
+    unit_id = request.args.get('unit_id', type=int)
+    if unit_id:
+        query = query.where(ServiceEvent.unit_id == unit_id)
+
+    periods = {}
+    for day, kind, count in db.session.execute(query):
+        bucket = periods.setdefault(service_period(day, period), {"calibration": 0, "maintenance": 0})
+        bucket[kind] = bucket.get(kind, 0) + count
+
+    return jsonify({
+        "period": period,
+        "from": str(date_from),
+        "to": str(date_to),
+        "branch_id": branch_id,
+        "unit_id": unit_id,
+        "periods": [{"period": label, **counts} for label, counts in sorted(periods.items())],
+    })
+
+@app.route('/api/equipments/<int:equipment_id>/history', methods=['GET'])
+@login_required
+def equipment_history(equipment_id):
+    """Service events of one equipment, newest first."""
+    limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+    events = (ServiceEvent.query
+              .filter_by(equipment_id=equipment_id)
+              .order_by(ServiceEvent.service_date.desc(), ServiceEvent.id.desc())
+              .limit(limit).all())
+    return jsonify([event.to_dict() for event in events])
+
 # In app.py, REPLACE your existing /api/admin/update_role/<int:user_id> route with this one
 
 @app.route('/api/admin/update_role/<int:user_id>', methods=['PUT'])
@@ -598,26 +1286,56 @@ def update_user_role(user_id):
 
         db.session.add(user)
         db.session.commit()
+        invalidate_cached_user(user_id)
+        invalidate_reference_data()
         return jsonify({"message": f"User '{user.username}' role updated successfully."}), 200
 
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
+def cache_metrics():
+    return [
+        ("user_cache_events_total", "counter", "User loader cache hits, misses and evictions.",
+         [({"event": name}, count) for name, count in user_cache_stats.items()]),
+        ("reference_cache_events_total", "counter", "Branch/unit cache hits, version checks and reloads.",
+         [({"event": name}, count) for name, count in reference_cache_stats.items()]),
+        ("outbox_messages", "gauge", "Outbox messages by status.",
+         [({"status": status}, count) for status, count in outbox_counts().items()]),
+        ("outbox_delivery_latency_seconds", "gauge",
+         "Average and maximum delivery latency of the messages still in the outbox, by status.",
+         [({"status": status, "stat": stat}, value)
+          for status, (average, maximum) in delivery_latency().items()
+          for stat, value in (("avg", average), ("max", maximum))]),
+    ]
+
+add_collector(cache_metrics)
+
+@app.route('/metrics')
+@limiter.exempt
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    if not (token and hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}")):
+        if not current_user.is_authenticated:
+            return login_manager.unauthorized()
+        if 'admin' not in current_user.roles:
+            return jsonify({"error": "Access denied"}), 403
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/units')
 @login_required
+@conditional('unit', 'branch')
 def get_units():
     if 'admin' not in current_user.roles:
         return jsonify({"error": "Access denied"}), 403
     
-    units = Unit.query.order_by(Unit.name).all()
     # We also include which user (if any) is the HOU for each unit
     return jsonify([{
         'id': unit.id,
         'name': unit.name,
-        'branch_name': unit.branch.name,
+        'branch_name': unit.branch_name,
         'hou_id': unit.hou_id
-    } for unit in units])
+    } for unit in get_reference_data().units])
 
 @app.route('/api/check-id-uniqueness')
 @login_required
@@ -645,51 +1363,119 @@ def logout():
     logout_user()
     return redirect(url_for('home'))
 
+SERVICE_TYPES = ('maintenance', 'calibration')
+
+def needs_notice(due_date, sent_due_date, sent_status, sent_at, now, reminder_days):
+    """Whether an item due on `due_date` should be (re)sent, given what the ledger says was last sent."""
+    if sent_due_date != due_date:
+        return True  # newly due, or serviced since and due again
+    if due_status(due_date, None) == 'Over Due' and sent_status != 'Over Due':
+        return True  # escalated from Due Soon to Over Due
+    return bool(reminder_days) and sent_at <= now - timedelta(days=reminder_days)
+
+def collect_due_notifications(upcoming_date, now=None, reminder_days=None):
+    """Groups what needs a notice under its unit's HOU email, in one joined query.
+
+    Items due by `upcoming_date` are checked against the NotificationLedger (outer-joined
+    once per service type) and only new, changed, escalated or reminder-due ones are kept.
+    Returns ({hou_email: {'maintenance': [...], 'calibration': [...]}}, rows_scanned, skipped).
+    Equipment due for both services comes back as a single row and can land in both lists.
+    """
+    now = now or datetime.utcnow()
+    sent = {service: aliased(NotificationLedger) for service in SERVICE_TYPES}
+    due_dates = {'maintenance': Equipment.next_maintenance_date, 'calibration': Equipment.next_calibration_date}
+
+    query = (
+        select(
+            User.email.label('hou_email'),
+            Equipment.id,
+            Equipment.name,
+            Equipment.new_id_number,
+            Equipment.next_maintenance_date,
+            Equipment.next_calibration_date,
+            *[column.label(f"{service}_sent_{column.key}")
+              for service in SERVICE_TYPES
+              for column in (sent[service].due_date, sent[service].status, sent[service].last_sent_at)],
+        )
+        .join(Unit, Equipment.unit_id == Unit.id)
+        .join(User, Unit.hou_id == User.id)
+        .where(or_(*(due_dates[service] <= upcoming_date for service in SERVICE_TYPES)), User.email.isnot(None))
+        .order_by(User.email, Equipment.id)
+    )
+    for service in SERVICE_TYPES:
+        query = query.outerjoin(sent[service], and_(sent[service].equipment_id == Equipment.id,
+                                                    sent[service].service_type == service))
+
+    notifications = {}
+    rows_scanned = skipped = 0
+    for row in db.session.execute(query):
+        rows_scanned += 1
+        for service in SERVICE_TYPES:
+            due_date = getattr(row, f"next_{service}_date")
+            if not due_date or due_date > upcoming_date:
+                continue
+            if needs_notice(due_date, getattr(row, f"{service}_sent_due_date"), getattr(row, f"{service}_sent_status"),
+                            getattr(row, f"{service}_sent_last_sent_at"), now, reminder_days):
+                tasks = notifications.setdefault(row.hou_email, {'maintenance': [], 'calibration': []})
+                tasks[service].append(row)
+            else:
+                skipped += 1
+    return notifications, rows_scanned, skipped
+
+def record_notices(tasks, now):
+    """Writes the ledger entries for delivered notices: one executemany UPDATE and one INSERT."""
+    ledger = NotificationLedger.__table__
+    updates, inserts = [], []
+    for service in SERVICE_TYPES:
+        for row in tasks[service]:
+            due_date = getattr(row, f"next_{service}_date")
+            entry = {"b_equipment_id": row.id, "b_service_type": service, "due_date": due_date,
+                     "status": due_status(due_date, None), "last_sent_at": now}
+            (updates if getattr(row, f"{service}_sent_due_date") else inserts).append(entry)
+
+    if updates:
+        db.session.execute(
+            ledger.update()
+            .where(ledger.c.equipment_id == bindparam('b_equipment_id'), ledger.c.service_type == bindparam('b_service_type'))
+            .values(due_date=bindparam('due_date'), status=bindparam('status'),
+                    last_sent_at=bindparam('last_sent_at'), sent_count=ledger.c.sent_count + 1),
+            updates
+        )
+    if inserts:
+        db.session.execute(ledger.insert(), [
+            {"equipment_id": entry["b_equipment_id"], "service_type": entry["b_service_type"], "due_date": entry["due_date"],
+             "status": entry["status"], "last_sent_at": now, "sent_count": 1}
+            for entry in inserts
+        ])
+
 def send_due_maintenance_notifications():
     with app.app_context():
-        today = datetime.utcnow().date()
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        today = now.date()
         upcoming_date = today + timedelta(days=30)
 
         # 1. Get all admins' emails once. They will be CC'd on all notifications.
-        admin_emails = [user.email for user in User.query.filter_by(roles='admin').all()]
+        admin_emails = list(db.session.execute(select(User.email).where(User.roles == 'admin')).scalars())
         if not admin_emails:
             print("No admin users found to receive notifications.")
 
-        # 2. Find all equipment due for maintenance or calibration
-        due_maintenance = Equipment.query.filter(
-            Equipment.next_maintenance_date.isnot(None),
-            Equipment.next_maintenance_date <= upcoming_date
-        ).all()
+        # 2. Find equipment due for maintenance or calibration that the HOU has not been told about yet,
+        #    grouped by their unit's HOU
+        notifications, rows_scanned, skipped = collect_due_notifications(
+            upcoming_date, now, app.config['NOTIFICATION_REMINDER_DAYS'])
+        maintenance_count = sum(len(tasks['maintenance']) for tasks in notifications.values())
+        calibration_count = sum(len(tasks['calibration']) for tasks in notifications.values())
+        print(f"Found {maintenance_count} equipment due for maintenance and {calibration_count} due for calibration "
+              f"to notify, {skipped} already notified ({rows_scanned} rows) in {(time.perf_counter() - started) * 1000:.1f}ms.")
 
-        due_calibration = Equipment.query.filter(
-            Equipment.next_calibration_date.isnot(None),
-            Equipment.next_calibration_date <= upcoming_date
-        ).all()
-        print(f"Found {len(due_maintenance)} equipment due for maintenance and {len(due_calibration)} due for calibration.")
-
-        # 3. Group equipment by their unit's HOU
-        notifications = {} # Key: hou_email, Value: {'maintenance': [], 'calibration': []}
-
-        for eq in due_maintenance:
-            if eq.unit and eq.unit.hou and eq.unit.hou.email:
-                hou_email = eq.unit.hou.email
-                if hou_email not in notifications:
-                    notifications[hou_email] = {'maintenance': [], 'calibration': []}
-                notifications[hou_email]['maintenance'].append(eq)
-
-        for eq in due_calibration:
-            if eq.unit and eq.unit.hou and eq.unit.hou.email:
-                hou_email = eq.unit.hou.email
-                if hou_email not in notifications:
-                    notifications[hou_email] = {'maintenance': [], 'calibration': []}
-                notifications[hou_email]['calibration'].append(eq)
-        
         print(f"Prepared notifications for {len(notifications)} HOUs.")
-        # 4. Send the targeted emails
+        # 3. Build one email per HOU
         if not notifications:
-            print("No equipment with assigned HOUs is due for service.")
-            return
+            print("No new or changed equipment with assigned HOUs is due for service.")
+            return {"rows_scanned": rows_scanned, "messages_sent": 0, "messages_failed": 0}
 
+        emails = []
         for hou_email, tasks in notifications.items():
             maintenance_list = tasks['maintenance']
             calibration_list = tasks['calibration']
@@ -719,22 +1505,51 @@ def send_due_maintenance_notifications():
             # The recipients are the HOU and all admins
             recipients = list(set([hou_email] + admin_emails))
             print(recipients)
+            emails.append(Email(to=recipients, subject=subject, body=final_body, tag=hou_email))
+
+        # 4. Queue them in the outbox and remember what was noticed, in one transaction, so the next run
+        #    only sends what changed. The deliver_outbox job sends them, with retries.
+        enqueue_emails([
+            (email, [(row.id, service, getattr(row, f"next_{service}_date"))
+                     for service in SERVICE_TYPES for row in notifications[email.tag][service]])
+            for email in emails
+        ])
+        record_notices({service: [row for tasks in notifications.values() for row in tasks[service]]
+                        for service in SERVICE_TYPES}, now)
+        db.session.commit()
+
+        print(f"Queued {len(emails)} notifications for {len(notifications)} HOUs "
+              f"in {time.perf_counter() - started:.2f}s.")
+        # messages_sent counts queued notices; deliveries are counted by the deliver_outbox runs
+        return {"rows_scanned": rows_scanned, "messages_sent": len(emails), "messages_failed": 0}
 
-            from_email_address = os.environ.get('SENDGRID_FROM_EMAIL')
-            from_name = os.environ.get('SENDGRID_FROM_NAME')
-            message = Mail(
-                from_email=(from_email_address, from_name),
-                to_emails=recipients,
-                subject=subject,
-                plain_text_content=final_body
-            )
-            try:
-                sg = SendGridAPIClient(os.environ.get('SENDGRID_API_KEY'))
-                response = sg.send(message)
-                print(f"Sent notification email. Status: {response.status_code}")
-                print(f"✅ Notification sent to {hou_email} (and admins) for {len(maintenance_list)} maintenance and {len(calibration_list)} calibration tasks.")
-            except Exception as e:
-                print(f"❌ Failed to send notification to {hou_email}: {e}")
+# Jobs run by scheduler.py, by name: (function, interval between runs)
+SCHEDULED_JOBS = {
+    'due_notifications': (send_due_maintenance_notifications, timedelta(hours=4)),
+    'deliver_outbox': (deliver_outbox, timedelta(minutes=1)),
+}
+
+@app.cli.command('run-job')
+@click.argument('name', type=click.Choice(sorted(SCHEDULED_JOBS)))
+@click.option('--force', is_flag=True, help="Run even if the job is not due yet (never while another run is in progress).")
+def run_job_command(name, force):
+    """Run a scheduled job now, through the same lease and run history as the scheduler."""
+    func, interval = SCHEDULED_JOBS[name]
+    run = run_job(name, func, interval, trigger='manual', force=force)
+    if run is None:
+        raise click.ClickException(f"{name} is already running or not due yet; use --force to run it anyway.")
+    if run.status != 'success':
+        raise click.ClickException(f"{name} failed: {run.error}")
+
+@app.cli.command('job-runs')
+@click.option('--job', 'job_name', help="Only show runs of this job.")
+@click.option('--limit', default=20, show_default=True)
+def job_runs_command(job_name, limit):
+    """Show the most recent job runs."""
+    for run in recent_runs(job_name, limit):
+        click.echo(f"{run.started_at:%Y-%m-%d %H:%M:%S} {run.job_name:20} {run.trigger:8} {run.status:8} "
+                   f"{(run.duration or 0):8.2f}s rows={run.rows_scanned} sent={run.messages_sent} "
+                   f"failed={run.messages_failed} {run.holder}")
 
 def get_reset_token(email):
     serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'])
@@ -767,38 +1582,18 @@ def api_forgot_password():
     token = get_reset_token(email)
     reset_url = url_for('reset_password', token=token, _external=True)
     
-    # --- This is the new SendGrid Part ---
-    from_email_address = os.environ.get('SENDGRID_FROM_EMAIL')
-    from_name = os.environ.get('SENDGRID_FROM_NAME')
-    from_email = (from_email_address, from_name)
     body = f'''To reset your password, visit the following link:
 {reset_url}
 
 If you did not make this request, simply ignore this email.
 '''
     
-    message = Mail(
-        from_email=from_email,
-        to_emails=email,
-        subject='Password Reset Request',
-        plain_text_content=body
-    )
-    
-    try:
-        sg = SendGridAPIClient(os.environ.get('SENDGRID_API_KEY'))
-        response = sg.send(message)
-        
-        # Optional: Log the success
-        print(f"Sent password reset. Status: {response.status_code}")
-        
-        return jsonify({"message": "Reset email sent"}), 200
-    
-    except Exception as e:
-        print(f"Error sending email via SendGrid: {e}")
-        # Log the detailed error from SendGrid if available
-        if hasattr(e, 'body'):
-            print(e.body)
-        return jsonify({"error": "Error sending email"}), 500
+    # Delivered by the deliver_outbox job, so the request does not wait for the provider
+    enqueue_email(Email(to=[email], subject='Password Reset Request', body=body, tag='password-reset'))
+    db.session.commit()
+    print("Queued password reset email.")
+
+    return jsonify({"message": "Reset email sent"}), 200
 
 @app.route('/reset-password/<token>', methods=['GET', 'POST'])
 def reset_password(token):
@@ -818,6 +1613,7 @@ def reset_password(token):
         
         user.set_password(password)
         db.session.commit()
+        invalidate_cached_user(user.id)
         return jsonify({"message": "Password updated successfully"}), 200
     
     return render_template('reset_password.html')
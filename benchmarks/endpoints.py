@@ -0,0 +1,289 @@
+"""Latency, throughput and query-count benchmark for the main endpoints.
+
+Builds a scratch database, fills it with a synthetic fleet (fleet.py), then
+drives each scenario through the Flask test client: first one request at a
+time, then with --concurrency threads each holding its own logged-in client.
+For every scenario it prints p50/p95/p99 latency, requests per second, SQL
+statements per request and errors.
+
+    python -m benchmarks.endpoints --equipment 10000 --requests 200 --concurrency 8
+    python -m benchmarks.endpoints --save-baseline benchmarks/baseline.json
+    python -m benchmarks.endpoints --baseline benchmarks/baseline.json --tolerance 0.25
+
+With --baseline the run exits with status 1 when a scenario's p95 is more
+than --tolerance slower than the baseline, or when it issues more queries
+per request on average. The database given by --url is wiped, so never point it at real
+data.
+
+The committed benchmarks/baseline.json was recorded with the first command
+above on the default SQLite database. Its query counts hold anywhere, but
+latencies depend on the machine: re-record it with --save-baseline before
+comparing p95s on other hardware.
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+# The app reads its configuration at import time.
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--url', help="Database URL (default: a temporary SQLite file)")
+parser.add_argument('--equipment', type=int, default=10000, help="Size of the synthetic fleet")
+parser.add_argument('--requests', type=int, default=100, help="Requests per scenario and mode")
+parser.add_argument('--concurrency', type=int, default=4, help="Threads for the concurrent run (1 to skip it)")
+parser.add_argument('--scenario', action='append', help="Only run these scenarios (repeatable)")
+parser.add_argument('--save-baseline', metavar='FILE', help="Write the results to FILE as JSON")
+parser.add_argument('--baseline', metavar='FILE', help="Compare against a file written by --save-baseline")
+parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed p95 slowdown against the baseline")
+
+PASSWORD = 'benchmark'
+
+
+def configure_environment(args):
+    os.environ['DATABASE_URL'] = args.url or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ['MAIL_TRANSPORT'] = 'fake'
+    # The limiter is switched off below; keep it from creating its counter database
+    os.environ['RATELIMIT_STORAGE_URI'] = 'memory://'
+
+
+class QueryCounter:
+    """Counts SQL statements per thread, so concurrent requests do not mix their numbers."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def __call__(self, *args, **kwargs):
+        self._local.count = self.count + 1
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+    def reset(self):
+        self._local.count = 0
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def build_scenarios(app, fleet, counter):
+    """Returns {name: request(client, i) -> status code}."""
+    from app import send_due_maintenance_notifications
+    from models import db, Equipment, NotificationLedger
+
+    with app.app_context():
+        unit_ids = [unit_id for unit_id, in db.session.query(Equipment.unit_id).distinct().limit(50)]
+        equipment_ids = [equipment_id for equipment_id, in db.session.query(Equipment.id).limit(5000)]
+    login = fleet['admin']
+    serial = itertools.count()
+    today = date.today().isoformat()
+
+    pages = threading.local()
+
+    def equipments_page(client, i):
+        # Each thread walks its own cursor chain through the first 50 pages, then starts over.
+        cursor = getattr(pages, 'cursor', None)
+        if getattr(pages, 'depth', 0) >= 50:
+            cursor, pages.depth = None, 0
+        query = {'limit': 20, 'cursor': cursor} if cursor else {'limit': 20}
+        response = client.get('/api/equipments', query_string=query)
+        pages.cursor = response.get_json().get('next_cursor') if response.status_code == 200 else None
+        pages.depth = getattr(pages, 'depth', 0) + 1 if pages.cursor else 0
+        return response.status_code
+
+    def equipments_search(client, i):
+        query = ['centrifuge', 'mettler', 'balance 0-220', 'eppendorf micro', 'spectro'][i % 5]
+        return client.get('/api/equipments', query_string={'q': query, 'limit': 20}).status_code
+
+    def login_request(client, i):
+        return client.post('/api/login', json={'login': login, 'password': PASSWORD}).status_code
+
+    def add_equipment(client, i):
+        n = next(serial)
+        return client.post('/api/add_equipments', json={
+            'name': f"Benchmark Balance {n}", 'manufacturer': 'Sartorius', 'model': 'BB-1',
+            'serial_number': f"BENCH{n}", 'new_id_number': f"BENCH-{fleet['tag']}-{n}",
+            'unit_id': unit_ids[n % len(unit_ids)], 'quantity': 1,
+            'calibration_frequency': 'Annual', 'calibration_date': today,
+            'maintenance_frequency': 'Quarterly', 'maintenance_date': today,
+            'parameters': [{'name': 'Range', 'value': '0-220 g'}, {'name': 'Readability', 'value': '0.1 mg'}],
+        }).status_code
+
+    def update_equipment(client, i):
+        equipment_id = equipment_ids[i % len(equipment_ids)]
+        return client.put(f'/api/updateEquipment/{equipment_id}', json={
+            'description': f"Updated by benchmark run {i}",
+            'parameters': [{'name': 'Range', 'value': f"0-{200 + i % 50} g"}],
+        }).status_code
+
+    def calibrate_equipment(client, i):
+        return client.put(f'/api/calibrate/{equipment_ids[i % len(equipment_ids)]}').status_code
+
+    def notifications(client, i):
+        # Forget what was sent so every run does the full scan and send.
+        with app.app_context():
+            db.session.query(NotificationLedger).delete()
+            db.session.commit()
+        counter.reset()
+        with contextlib.redirect_stdout(io.StringIO()):
+            send_due_maintenance_notifications()
+        return 200
+
+    return {
+        'equipments_page': equipments_page,
+        'equipments_search': equipments_search,
+        'login': login_request,
+        'add_equipment': add_equipment,
+        'update_equipment': update_equipment,
+        'calibrate_equipment': calibrate_equipment,
+        'notifications': notifications,
+    }
+
+
+def make_client(app, login):
+    client = app.test_client()
+    client.environ_base['wsgi.url_scheme'] = 'https'
+    response = client.post('/api/login', json={'login': login, 'password': PASSWORD}, base_url='https://localhost')
+    if response.status_code != 200:
+        sys.exit(f"Could not log in as {login}: {response.status_code}")
+    return client
+
+
+def run(request, clients, count, counter):
+    latencies, queries, errors = [], [], 0
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(i):
+        nonlocal errors
+        if not hasattr(local, 'client'):
+            with lock:
+                local.client = clients.pop()
+        counter.reset()
+        started = time.perf_counter()
+        try:
+            ok = request(local.client, i) < 400
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed * 1000)
+            queries.append(counter.count)
+            errors += not ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+        list(pool.map(one, range(count)))
+    elapsed = time.perf_counter() - started
+    return {
+        "n": count,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "rps": round(count / elapsed, 1),
+        "queries": round(statistics.mean(queries), 1),
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for key, result in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        if result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{key}: p95 {before['p95_ms']}ms -> {result['p95_ms']}ms")
+        # Half a query of slack absorbs the occasional cache refresh.
+        if result["queries"] > before["queries"] + 0.5:
+            regressions.append(f"{key}: queries/request {before['queries']} -> {result['queries']}")
+    return regressions
+
+
+def main():
+    args = parser.parse_args()
+    configure_environment(args)
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    import app as app_module
+    from app import app
+    from fleet import generate_fleet
+    from models import db, User, Unit
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['RATELIMIT_ENABLED'] = False
+    app_module.limiter.enabled = False
+
+    counter = QueryCounter()
+    event.listen(Engine, 'after_cursor_execute', counter)
+
+    started = time.perf_counter()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        fleet = generate_fleet(args.equipment, password=PASSWORD)
+        # Every scenario runs as an admin, who sees the whole fleet.
+        admin = User(username=f"bench-admin-{fleet['tag']}", email=f"bench-admin-{fleet['tag']}@example.com",
+                     roles='admin', unit_id=db.session.query(Unit.id).first()[0])
+        admin.set_password(PASSWORD)
+        db.session.add(admin)
+        db.session.commit()
+        fleet['admin'] = admin.username
+    print(f"Generated {fleet['equipment']} equipment, {fleet['users']} users in {time.perf_counter() - started:.1f}s "
+          f"({app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0]})")
+
+    scenarios = build_scenarios(app, fleet, counter)
+    selected = args.scenario or list(scenarios)
+    unknown = set(selected) - set(scenarios)
+    if unknown:
+        sys.exit(f"Unknown scenario(s): {', '.join(sorted(unknown))}. Choose from {', '.join(scenarios)}.")
+
+    modes = [1] + ([args.concurrency] if args.concurrency > 1 else [])
+    results = {}
+    print(f"{'scenario':22} {'threads':>7} {'n':>5} {'err':>4} {'p50':>9} {'p95':>9} {'p99':>9} {'req/s':>8} {'queries':>8}")
+    for name in selected:
+        for threads in modes:
+            # Notifications scan the whole fleet and wipe the ledger; running them in parallel measures nothing useful.
+            if name == 'notifications' and threads > 1:
+                continue
+            count = min(args.requests, 10) if name == 'notifications' else args.requests
+            clients = [make_client(app, fleet['admin']) for _ in range(threads)]
+            result = run(scenarios[name], clients, count, counter)
+            results[f"{name}@{threads}"] = result
+            print(f"{name:22} {threads:7} {result['n']:5} {result['errors']:4} {result['p50_ms']:7.1f}ms "
+                  f"{result['p95_ms']:7.1f}ms {result['p99_ms']:7.1f}ms {result['rps']:8.1f} {result['queries']:8.1f}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({"equipment": args.equipment, "results": results}, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("equipment") != args.equipment:
+            print(f"Warning: baseline was recorded with {baseline.get('equipment')} equipment, this run used {args.equipment}.")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print("Regressions against the baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == '__main__':
+    main()
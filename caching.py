@@ -0,0 +1,39 @@
+import hashlib
+from datetime import datetime
+from functools import wraps
+from flask import request, make_response, current_app
+from models import get_change_versions
+
+
+def compute_etag(tables):
+    """Strong ETag for a response built from `tables`.
+
+    Combines the tables' change versions, today's date (statuses such as
+    'Due Soon' move with the calendar) and the full request path, so every
+    page/filter combination gets its own tag.
+    """
+    versions = get_change_versions(tables)
+    fingerprint = "|".join(f"{name}:{versions[name]}" for name in tables)
+    fingerprint += f"|{datetime.utcnow().date()}|{request.full_path}"
+    return hashlib.sha1(fingerprint.encode()).hexdigest()
+
+
+def conditional(*tables):
+    """Answers If-None-Match with 304 before the view runs, so unchanged data costs one small query."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = compute_etag(tables)
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            # Let the browser keep a copy but revalidate it on every use.
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,98 @@
+"""Engine settings for SQLite and PostgreSQL deployments.
+
+SQLite: every connection switches to WAL, so readers no longer wait for the
+writer. It also sets synchronous=NORMAL (safe with WAL, one fsync per
+checkpoint instead of per commit) and waits up to busy_timeout for the write
+lock instead of failing with "database is locked". Reads go through
+mmap_size bytes of memory-mapped I/O.
+
+PostgreSQL: the pool is sized from the gunicorn worker and thread counts, so
+every worker gets a connection per thread and the total stays under the
+server's connection limit. Connections are pinged before use, recycled
+before idle proxies drop them, and run with a statement timeout.
+
+The settings come from the environment:
+
+    WEB_CONCURRENCY          gunicorn workers (gunicorn reads the same variable)
+    GUNICORN_THREADS         threads per worker
+    DB_MAX_CONNECTIONS       server connection limit shared by all workers (default 20)
+    DB_STATEMENT_TIMEOUT     PostgreSQL statement timeout in ms (default 30000, 0 = none)
+    DB_POOL_RECYCLE          seconds before a pooled connection is replaced (default 1800)
+    SQLITE_BUSY_TIMEOUT      ms to wait for the SQLite write lock (default 5000)
+    SQLITE_MMAP_SIZE         bytes of SQLite memory-mapped I/O (default 256 MiB)
+
+Long maintenance commands on PostgreSQL (a migration backfill, a full
+search reindex) may need DB_STATEMENT_TIMEOUT=0.
+"""
+import os
+from sqlalchemy import event
+
+# Connections kept back from the web pools for the scheduler worker and one-off commands.
+RESERVED_CONNECTIONS = 3
+
+
+def _int(environ, name, default):
+    return int(environ.get(name) or default)
+
+
+def sqlite_pragmas(environ=os.environ):
+    return {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': _int(environ, 'SQLITE_BUSY_TIMEOUT', 5000),
+        'mmap_size': _int(environ, 'SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+    }
+
+
+def pool_sizes(environ=os.environ):
+    """(pool_size, max_overflow) of the app engine in each worker process.
+
+    A request holds at most one session connection, so a worker keeps one per
+    thread. The rate limiter gets as many again (see app.py). Up to one more
+    per thread, within the worker's share of DB_MAX_CONNECTIONS, is overflow
+    for bursts.
+    """
+    workers = _int(environ, 'WEB_CONCURRENCY', 1)
+    threads = _int(environ, 'GUNICORN_THREADS', 1)
+    share = max(2, (_int(environ, 'DB_MAX_CONNECTIONS', 20) - RESERVED_CONNECTIONS) // workers)
+    pool_size = max(1, min(threads, share // 2))
+    return pool_size, max(0, min(threads, share - 2 * pool_size))
+
+
+def engine_options(uri, environ=os.environ):
+    """SQLALCHEMY_ENGINE_OPTIONS for `uri`."""
+    if not uri.startswith('postgresql'):
+        return {}
+    pool_size, max_overflow = pool_sizes(environ)
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_pre_ping': True,
+        'pool_recycle': _int(environ, 'DB_POOL_RECYCLE', 1800),
+        'pool_timeout': 10,
+    }
+    statement_timeout = _int(environ, 'DB_STATEMENT_TIMEOUT', 30000)
+    if statement_timeout:
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+
+def apply_sqlite_pragmas(engine, pragmas=None):
+    """Runs the PRAGMAs on every new connection of a SQLite `engine`; other engines are left alone."""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = pragmas or sqlite_pragmas()
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def init_db_tuning(app, db):
+    """Applies the SQLite PRAGMAs to the app's engines; call after db.init_app(app)."""
+    with app.app_context():
+        for engine in db.engines.values():
+            apply_sqlite_pragmas(engine)
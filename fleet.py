@@ -0,0 +1,151 @@
+"""Synthetic fleet generator for load tests and benchmarks.
+
+Creates branches -> units (each with an HOU) -> users -> equipment ->
+parameters with plausible names, manufacturers, frequencies and a spread of
+OK / Due Soon / Over Due dates. Rows are written with chunked Core inserts,
+one transaction per chunk, and go through the same bookkeeping as the
+importer: next dates, change versions, the search index and a service
+event for each recorded date.
+
+Used by `flask generate-fleet` and benchmarks/endpoints.py. Every name
+carries a run tag, so fleets can be added to a database that already has
+data.
+"""
+import random
+from datetime import date, timedelta
+from sqlalchemy import bindparam, insert
+from passwords import hash_password
+from models import (db, User, Unit, Branch, Equipment, EquipmentParameter,
+                    next_service_date, bump_change_versions, record_service_events)
+from search import reindex_equipment
+
+CHUNK_SIZE = 5000
+
+# Fleet sizes accepted by `flask generate-fleet --size`.
+SIZES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+
+CITIES = ['Lagos', 'Abuja', 'Kano', 'Ibadan', 'Port Harcourt', 'Enugu', 'Kaduna', 'Benin City',
+          'Jos', 'Ilorin', 'Owerri', 'Calabar', 'Abeokuta', 'Uyo', 'Sokoto', 'Maiduguri']
+LABS = ['Chemistry', 'Microbiology', 'Haematology', 'Biochemistry', 'Quality Control',
+        'Metrology', 'Pharmacology', 'Histology', 'Virology', 'Serology', 'Toxicology', 'Immunology']
+
+# (name, manufacturers, parameters)
+CATALOGUE = [
+    ('Analytical Balance', ['Mettler Toledo', 'Sartorius', 'Ohaus'], [('Range', '0-220 g'), ('Readability', '0.1 mg')]),
+    ('pH Meter', ['Hanna', 'Mettler Toledo', 'Thermo Fisher'], [('Range', '0-14 pH'), ('Accuracy', '±0.01 pH')]),
+    ('Centrifuge', ['Eppendorf', 'Thermo Fisher', 'Hettich'], [('Max speed', '15000 rpm'), ('Capacity', '24 x 2 mL')]),
+    ('Incubator', ['Memmert', 'Binder', 'Thermo Fisher'], [('Temperature range', '5-70 °C'), ('Volume', '150 L')]),
+    ('Autoclave', ['Tuttnauer', 'Systec', 'Astell'], [('Chamber volume', '75 L'), ('Max temperature', '134 °C')]),
+    ('Spectrophotometer', ['Shimadzu', 'Agilent', 'Thermo Fisher'], [('Wavelength', '190-1100 nm'), ('Bandwidth', '1 nm')]),
+    ('Micropipette', ['Eppendorf', 'Gilson', 'Sartorius'], [('Volume', '100-1000 µL'), ('Accuracy', '±0.6 %')]),
+    ('Fume Hood', ['Esco', 'Labconco'], [('Face velocity', '0.5 m/s')]),
+    ('Laboratory Refrigerator', ['Liebherr', 'Thermo Fisher'], [('Temperature range', '2-8 °C')]),
+    ('HPLC System', ['Agilent', 'Waters', 'Shimadzu'], [('Flow rate', '0.001-10 mL/min'), ('Max pressure', '600 bar')]),
+    ('Thermometer', ['Fluke', 'Testo'], [('Range', '-50-300 °C'), ('Resolution', '0.1 °C')]),
+    ('Water Bath', ['Grant', 'Julabo', 'Memmert'], [('Temperature range', '5-99 °C')]),
+]
+
+# Frequency mix, including a custom interval.
+FREQUENCY_WEIGHTS = [('Annual', 50), ('Semi-Annual', 25), ('Quarterly', 15), ('Monthly', 8), ('Every 18 months', 2)]
+INTERVAL_DAYS = {'Annual': 365, 'Semi-Annual': 182, 'Quarterly': 91, 'Monthly': 30, 'Every 18 months': 548}
+
+
+def _last_service(rng, frequency, today):
+    # Up to 30% past the interval, so a share of the fleet is Due Soon or Over Due.
+    if rng.random() < 0.03:
+        return None  # never recorded
+    return today - timedelta(days=rng.randint(0, int(INTERVAL_DAYS[frequency] * 1.3)))
+
+
+def generate_fleet(equipment_count, branches=10, units_per_branch=6, users_per_unit=4,
+                   password='password', seed=42, tag=None, chunk_size=CHUNK_SIZE, progress=None):
+    """Adds a synthetic fleet and returns {'tag', 'branches', 'units', 'users', 'equipment', 'parameters'}.
+
+    Every user gets `password`. `progress(done, total)` is called after each equipment chunk.
+    """
+    rng = random.Random(seed)
+    tag = tag or f"{seed:x}{rng.randrange(16 ** 4):04x}"
+    today = date.today()
+    password_hash = hash_password(password)
+    frequencies, weights = zip(*FREQUENCY_WEIGHTS)
+
+    branch_ids = db.session.execute(insert(Branch).returning(Branch.id), [
+        {"name": f"{CITIES[b % len(CITIES)]} {tag}-{b}", "address": f"{rng.randint(1, 200)} Synthetic Road"}
+        for b in range(branches)
+    ]).scalars().all()
+    unit_ids = db.session.execute(insert(Unit).returning(Unit.id), [
+        {"name": f"{LABS[u % len(LABS)]} {tag}-{b}-{u}", "branch_id": branch_id}
+        for b, branch_id in enumerate(branch_ids)
+        for u in range(units_per_branch)
+    ]).scalars().all()
+
+    users = []
+    for u, unit_id in enumerate(unit_ids):
+        for n in range(users_per_unit):
+            # The first user of each unit heads it; one in fifty is an admin.
+            role = 'hou' if n == 0 else ('admin' if rng.random() < 0.02 else 'user')
+            users.append({"username": f"{role}-{tag}-{u}-{n}", "email": f"{role}-{tag}-{u}-{n}@example.com",
+                          "roles": role, "password_hash": password_hash, "unit_id": unit_id})
+    user_ids = db.session.execute(insert(User).returning(User.id, User.unit_id, User.roles), users).all()
+    hou_by_unit = {unit_id: user_id for user_id, unit_id, role in user_ids if role == 'hou'}
+    db.session.execute(Unit.__table__.update().where(Unit.__table__.c.id == bindparam('b_id'))
+                       .values(hou_id=bindparam('b_hou_id')),
+                       [{"b_id": unit_id, "b_hou_id": hou_id} for unit_id, hou_id in hou_by_unit.items()])
+    bump_change_versions(db.session.connection(), ['branch', 'unit', 'user'])
+    db.session.commit()
+
+    parameter_count = 0
+    for start in range(0, equipment_count, chunk_size):
+        rows, parameters = [], []
+        for i in range(start, min(start + chunk_size, equipment_count)):
+            name, manufacturers, item_parameters = rng.choice(CATALOGUE)
+            calibration_frequency = rng.choices(frequencies, weights)[0]
+            maintenance_frequency = rng.choices(frequencies, weights)[0]
+            calibration_date = _last_service(rng, calibration_frequency, today)
+            maintenance_date = _last_service(rng, maintenance_frequency, today)
+            rows.append({
+                "name": f"{name} {i + 1:07d}",
+                "manufacturer": rng.choice(manufacturers),
+                "model": f"{name[:3].upper()}-{rng.randint(100, 999)}",
+                "serial_number": f"SN{tag.upper()}{i:08d}",
+                "new_id_number": f"SYN-{tag}-{i:07d}",
+                "unit_id": rng.choice(unit_ids),
+                "calibration_frequency": calibration_frequency,
+                "calibration_date": calibration_date,
+                "next_calibration_date": next_service_date(calibration_date, calibration_frequency),
+                "maintenance_frequency": maintenance_frequency,
+                "maintenance_date": maintenance_date,
+                "next_maintenance_date": next_service_date(maintenance_date, maintenance_frequency),
+                "description": f"{name} used by the {rng.choice(LABS).lower()} bench",
+                "quantity": rng.choice([1, 1, 1, 1, 2, 3]),
+            })
+            parameters.append(item_parameters)
+
+        ids = db.session.execute(insert(Equipment).returning(Equipment.id, Equipment.new_id_number), rows).all()
+        ids_by_number = {new_id_number: equipment_id for equipment_id, new_id_number in ids}
+        parameter_rows = [
+            {"equipment_id": ids_by_number[row["new_id_number"]], "parameter_name": parameter_name,
+             "parameter_value": parameter_value}
+            for row, item_parameters in zip(rows, parameters)
+            for parameter_name, parameter_value in item_parameters
+        ]
+        db.session.execute(insert(EquipmentParameter), parameter_rows)
+        parameter_count += len(parameter_rows)
+
+        connection = db.session.connection()
+        bump_change_versions(connection, ['equipment', 'equipment_parameter'])
+        reindex_equipment(connection, ids_by_number.values())
+        for kind in ('calibration', 'maintenance'):
+            record_service_events(connection, ids_by_number.values(), kind, source='synthetic')
+        db.session.commit()
+        if progress:
+            progress(start + len(rows), equipment_count)
+
+    return {
+        "tag": tag,
+        "branches": len(branch_ids),
+        "units": len(unit_ids),
+        "users": len(user_ids),
+        "equipment": equipment_count,
+        "parameters": parameter_count,
+    }
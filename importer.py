@@ -0,0 +1,266 @@
+"""Bulk equipment import from CSV or XLSX files.
+
+Used by POST /api/equipments/import and the `flask import-equipment` command.
+The whole file is validated first, with set-based lookups for units and ID
+numbers. Valid rows are then inserted in chunks, one transaction per chunk.
+Invalid rows are skipped and reported by their line number in the file.
+"""
+import csv
+import io
+from datetime import datetime, date
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DataError, IntegrityError
+from models import db, Equipment, EquipmentParameter, Unit, frequency_error, next_service_date, bump_change_versions, record_service_events
+from search import reindex_equipment
+
+IMPORT_CHUNK_SIZE = 500
+# Keeps IN (...) lists under the bound-parameter limits of SQLite and psycopg2.
+LOOKUP_CHUNK_SIZE = 5000
+
+COLUMNS = (
+    'name', 'manufacturer', 'model', 'serial_number', 'new_id_number', 'unit_id',
+    'calibration_frequency', 'calibration_date', 'maintenance_frequency', 'maintenance_date',
+    'description', 'quantity', 'parameters',
+)
+
+
+UNREADABLE_FILE = "File must be UTF-8 encoded CSV or XLSX"
+
+
+class ImportFileError(ValueError):
+    """The file as a whole cannot be read (bad format, missing columns...)."""
+
+
+def read_rows(stream, filename):
+    """Returns the data rows of a CSV/XLSX file as (line number, dict keyed by lower-cased header)."""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'csv':
+        try:
+            rows = list(csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')))
+        except (UnicodeDecodeError, csv.Error):
+            raise ImportFileError(UNREADABLE_FILE)
+    elif extension == 'xlsx':
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ImportFileError("XLSX import requires the openpyxl package.")
+        try:
+            workbook = load_workbook(stream, read_only=True, data_only=True)
+            rows = [list(row) for row in workbook.active.iter_rows(values_only=True)]
+            workbook.close()
+        except Exception:
+            # openpyxl raises zipfile, KeyError and XML errors alike on a damaged or mislabelled file.
+            raise ImportFileError(UNREADABLE_FILE)
+    else:
+        raise ImportFileError("Only .csv and .xlsx files can be imported.")
+
+    if not rows:
+        raise ImportFileError("The file is empty.")
+
+    header = [str(cell or '').strip().lower().replace(' ', '_') for cell in rows[0]]
+    missing = {'name', 'new_id_number', 'unit_id'} - set(header)
+    if missing:
+        raise ImportFileError(f"Missing required column(s): {', '.join(sorted(missing))}.")
+
+    records = []
+    # Line numbers count the header as line 1, as spreadsheets do.
+    for line, values in enumerate(rows[1:], start=2):
+        if all(value is None or str(value).strip() == '' for value in values):
+            continue  # trailing blank lines / empty spreadsheet rows
+        records.append((line, {column: value for column, value in zip(header, values) if column in COLUMNS}))
+    return records
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(_text(value), "%Y-%m-%d").date()
+
+
+def _parse_parameters(value):
+    """'Range=0-200 mg; Accuracy=0.1 mg' -> [('Range', '0-200 mg'), ('Accuracy', '0.1 mg')]"""
+    parameters = []
+    for part in _text(value).split(';'):
+        name, _, param_value = part.partition('=')
+        if name.strip() and param_value.strip():
+            parameters.append((name.strip(), param_value.strip()))
+    return parameters
+
+
+def validate_row(record):
+    """Field-level checks, mirroring add_equipment. Returns (clean_row, errors)."""
+    errors = {}
+
+    name = _text(record.get('name'))
+    manufacturer = _text(record.get('manufacturer'))
+    model = _text(record.get('model'))
+    new_id_number = _text(record.get('new_id_number'))
+
+    if len(name) < 3:
+        errors['name'] = 'Equipment name is required and must be at least 3 characters.'
+    if len(manufacturer) < 2:
+        errors['manufacturer'] = 'Manufacturer is required and must be at least 2 characters.'
+    if not model:
+        errors['model'] = 'Model is required.'
+    if not new_id_number:
+        errors['new_id_number'] = 'A unique ID Number is required.'
+
+    unit_id = None
+    try:
+        unit_id = int(_text(record.get('unit_id')))
+    except ValueError:
+        errors['unit_id'] = 'A valid unit must be selected.'
+
+    dates = {}
+    for field, label in (('calibration_date', 'Calibration'), ('maintenance_date', 'Maintenance')):
+        if not _text(record.get(field)):
+            errors[field] = f'{label} date is required.'
+            continue
+        try:
+            dates[field] = _parse_date(record.get(field))
+        except ValueError:
+            errors[field] = 'Invalid date format. Please use YYYY-MM-DD.'
+
+    for field in ('calibration_frequency', 'maintenance_frequency'):
+        message = frequency_error(_text(record.get(field)))
+        if message:
+            errors[field] = message
+
+    quantity = 1
+    if _text(record.get('quantity')):
+        try:
+            quantity = int(_text(record.get('quantity')))
+            if quantity < 1:
+                errors['quantity'] = 'Quantity must be at least 1.'
+        except ValueError:
+            errors['quantity'] = 'Quantity must be a valid number.'
+
+    if errors:
+        return None, errors
+
+    calibration_frequency = _text(record.get('calibration_frequency')) or 'Annual'
+    maintenance_frequency = _text(record.get('maintenance_frequency')) or 'Annual'
+    row = {
+        "name": name,
+        "manufacturer": manufacturer,
+        "model": model,
+        "serial_number": _text(record.get('serial_number')),
+        "new_id_number": new_id_number,
+        "unit_id": unit_id,
+        "calibration_frequency": calibration_frequency,
+        "calibration_date": dates['calibration_date'],
+        # Computed here because bulk inserts skip the before_insert listener.
+        "next_calibration_date": next_service_date(dates['calibration_date'], calibration_frequency),
+        "maintenance_frequency": maintenance_frequency,
+        "maintenance_date": dates['maintenance_date'],
+        "next_maintenance_date": next_service_date(dates['maintenance_date'], maintenance_frequency),
+        "description": _text(record.get('description')),
+        "quantity": quantity,
+        "created_at": datetime.utcnow(),
+    }
+    return (row, _parse_parameters(record.get('parameters'))), {}
+
+
+def _existing(column, values):
+    values = list(values)
+    found = set()
+    for start in range(0, len(values), LOOKUP_CHUNK_SIZE):
+        chunk = values[start:start + LOOKUP_CHUNK_SIZE]
+        found.update(db.session.execute(select(column).where(column.in_(chunk))).scalars())
+    return found
+
+
+def _insert_chunk(chunk, actor):
+    """Inserts the (line, row, parameters) triples from import_equipment() in one transaction."""
+    inserted = db.session.execute(
+        insert(Equipment).returning(Equipment.id, Equipment.new_id_number),
+        [row for _, row, _ in chunk],
+    ).all()
+    ids = {new_id_number: equipment_id for equipment_id, new_id_number in inserted}
+    parameter_rows = [
+        {"equipment_id": ids[row["new_id_number"]], "parameter_name": name, "parameter_value": value}
+        for _, row, parameters in chunk
+        for name, value in parameters
+    ]
+    if parameter_rows:
+        db.session.execute(insert(EquipmentParameter), parameter_rows)
+    bump_change_versions(db.session.connection(), ['equipment', 'equipment_parameter'])
+    reindex_equipment(db.session.connection(), ids.values())
+    # The imported dates are the last services on record.
+    for kind in ('calibration', 'maintenance'):
+        record_service_events(db.session.connection(), ids.values(), kind, actor=actor, source='import')
+    db.session.commit()
+
+
+def import_equipment(records, dry_run=False, actor=None):
+    """Validates and inserts the (line, record) pairs from read_rows(). Returns a report dict.
+
+    `actor` is the user recorded on the service events appended for the imported dates.
+    """
+    valid, errors = [], []
+    for line, record in records:
+        result, row_errors = validate_row(record)
+        if row_errors:
+            errors.append({"row": line, "errors": row_errors})
+        else:
+            valid.append((line, result))
+
+    # Set-based checks: one lookup for units and one for ID numbers, however many rows.
+    unit_ids = _existing(Unit.id, {row["unit_id"] for _, (row, _) in valid})
+    taken_ids = _existing(Equipment.new_id_number, {row["new_id_number"] for _, (row, _) in valid})
+
+    accepted, seen_ids = [], set()
+    for line, (row, parameters) in valid:
+        row_errors = {}
+        if row["unit_id"] not in unit_ids:
+            row_errors['unit_id'] = 'A valid unit must be selected.'
+        if row["new_id_number"] in taken_ids:
+            row_errors['new_id_number'] = f"An equipment with the ID '{row['new_id_number']}' already exists."
+        elif row["new_id_number"] in seen_ids:
+            row_errors['new_id_number'] = f"The ID '{row['new_id_number']}' appears more than once in the file."
+        seen_ids.add(row["new_id_number"])
+        if row_errors:
+            errors.append({"row": line, "errors": row_errors})
+        else:
+            accepted.append((line, row, parameters))
+
+    report = {"total": len(records), "created": 0, "failed": 0, "errors": errors, "dry_run": dry_run}
+    if dry_run or not accepted:
+        errors.sort(key=lambda error: error["row"])
+        report["failed"] = len(errors)
+        return report
+
+    for start in range(0, len(accepted), IMPORT_CHUNK_SIZE):
+        chunk = accepted[start:start + IMPORT_CHUNK_SIZE]
+        try:
+            _insert_chunk(chunk, actor)
+            report["created"] += len(chunk)
+        except (IntegrityError, DataError):
+            # An ID number taken by a concurrent insert since validation ran, or a value the
+            # database rejects (e.g. too long for its column on PostgreSQL). Retry the chunk
+            # row by row so only the offending rows are reported.
+            db.session.rollback()
+            for line, row, parameters in chunk:
+                try:
+                    _insert_chunk([(line, row, parameters)], actor)
+                    report["created"] += 1
+                except (IntegrityError, DataError) as e:
+                    db.session.rollback()
+                    # The driver message names tables and constraints; it goes to the log, not the client.
+                    print(f"Import row {line} rejected by the database: {e.orig}")
+                    errors.append({"row": line, "errors": {"database": "Row could not be saved; check its values "
+                                                                       "for length and duplicate ID numbers."}})
+
+    errors.sort(key=lambda error: error["row"])
+    report["failed"] = len(errors)
+    return report
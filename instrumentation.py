@@ -0,0 +1,187 @@
+"""Per-request timing, Server-Timing headers and Prometheus metrics.
+
+Every request records wall time, SQL time and statement count, JSON/template
+serialization time and response size. The numbers are sent back as a
+Server-Timing header and folded into per-endpoint histograms, which
+render_metrics() writes in the Prometheus text format for /metrics.
+Histograms live in process memory, so each gunicorn worker reports its own
+series. Prometheus sums them across instances.
+
+Other modules can publish counters or gauges with add_collector().
+"""
+import threading
+import time
+from flask import g, request, has_request_context, template_rendered, before_render_template
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name -> (help, buckets)
+HISTOGRAMS = {
+    'http_request_duration_seconds': ("Wall time from the first before_request hook to the response.", DURATION_BUCKETS),
+    'http_request_db_seconds': ("Time spent executing SQL.", DURATION_BUCKETS),
+    'http_request_queries': ("SQL statements executed.", QUERY_BUCKETS),
+    'http_request_serialization_seconds': ("Time spent encoding JSON and rendering templates.", DURATION_BUCKETS),
+    'http_response_size_bytes': ("Response body size; streamed responses are not counted.", SIZE_BUCKETS),
+}
+
+_lock = threading.Lock()
+_histograms = {}  # (name, endpoint, method) -> [bucket counts..., +Inf count, sum]
+_requests = {}  # (endpoint, method, status) -> count
+_collectors = []
+
+
+# The start time lives on the statement's execution context, so a statement that
+# fails (and never reaches after_cursor_execute) leaves nothing behind.
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_started', None)
+    # Only count statements issued while a request is being tracked
+    if started is not None and has_request_context() and 'query_count' in g:
+        g.query_count += 1
+        g.query_time += time.perf_counter() - started
+
+
+def _add_serialization_time(seconds):
+    if has_request_context() and 'serialization_time' in g:
+        g.serialization_time += seconds
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, timing each dumps() for the current request."""
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            _add_serialization_time(time.perf_counter() - started)
+
+
+def _start_render(sender, template, context, **extra):
+    if has_request_context():
+        g.render_started = time.perf_counter()
+
+def _end_render(sender, template, context, **extra):
+    if has_request_context() and 'render_started' in g:
+        _add_serialization_time(time.perf_counter() - g.pop('render_started'))
+
+
+def observe(name, endpoint, method, value):
+    buckets = HISTOGRAMS[name][1]
+    key = (name, endpoint, method)
+    with _lock:
+        counts = _histograms.get(key)
+        if counts is None:
+            counts = _histograms[key] = [0] * (len(buckets) + 2)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                counts[i] += 1
+        counts[-2] += 1
+        counts[-1] += value
+
+
+def add_collector(collect):
+    """Registers `collect() -> [(name, type, help, [(labels dict, value), ...]), ...]` for /metrics."""
+    _collectors.append(collect)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+def render_metrics():
+    """Everything recorded by this process, in the Prometheus text exposition format."""
+    with _lock:
+        histograms = {key: list(counts) for key, counts in _histograms.items()}
+        requests = dict(_requests)
+
+    lines = ["# HELP http_requests_total Requests handled, by endpoint, method and status.",
+             "# TYPE http_requests_total counter"]
+    for (endpoint, method, status), count in sorted(requests.items()):
+        lines.append(f"http_requests_total{{{_labels(endpoint=endpoint, method=method, status=status)}}} {count}")
+
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for (metric, endpoint, method), counts in sorted(histograms.items()):
+            if metric != name:
+                continue
+            labels = _labels(endpoint=endpoint, method=method)
+            for bound, count in zip(buckets, counts):
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {counts[-2]}')
+            lines.append(f"{name}_sum{{{labels}}} {counts[-1]}")
+            lines.append(f"{name}_count{{{labels}}} {counts[-2]}")
+
+    for collect in _collectors:
+        for name, type_, help_text, samples in collect():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {type_}"]
+            for labels, value in samples:
+                lines.append(f"{name}{{{_labels(**labels)}}} {value}" if labels else f"{name} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def init_instrumentation(app, db):
+    """Times every request and exposes the numbers as headers and histograms; call after db.init_app(app).
+
+    Only statements on the app's own engines are counted, not those of
+    other engines such as the rate limiter's. Server-Timing is sent unless
+    SERVER_TIMING is False. X-Query-Count / X-Query-Time and a log line per
+    request are added in debug mode, or explicitly with the QUERY_STATS
+    config key.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    app.json = TimedJSONProvider(app)
+    before_render_template.connect(_start_render, app)
+    template_rendered.connect(_end_render, app)
+
+    @app.before_request
+    def start_request_stats():
+        g.request_started = time.perf_counter()
+        g.query_count = 0
+        g.query_time = 0.0
+        g.serialization_time = 0.0
+
+    @app.after_request
+    def report_request_stats(response):
+        if 'request_started' not in g:
+            return response
+        total = time.perf_counter() - g.request_started
+        endpoint = request.endpoint or 'unmatched'
+        method = request.method
+
+        if app.config.get('SERVER_TIMING', True):
+            response.headers['Server-Timing'] = (
+                f'db;dur={g.query_time * 1000:.2f};desc="{g.query_count} queries", '
+                f'serialize;dur={g.serialization_time * 1000:.2f}, '
+                f'total;dur={total * 1000:.2f}'
+            )
+        if app.config.get('QUERY_STATS', app.debug):
+            query_ms = g.query_time * 1000
+            response.headers['X-Query-Count'] = str(g.query_count)
+            response.headers['X-Query-Time'] = f"{query_ms:.2f}ms"
+            app.logger.info("%s %s: %d queries in %.2fms", method, request.path, g.query_count, query_ms)
+
+        observe('http_request_duration_seconds', endpoint, method, total)
+        observe('http_request_db_seconds', endpoint, method, g.query_time)
+        observe('http_request_queries', endpoint, method, g.query_count)
+        observe('http_request_serialization_seconds', endpoint, method, g.serialization_time)
+        if not response.is_streamed:
+            observe('http_response_size_bytes', endpoint, method, response.calculate_content_length() or 0)
+        with _lock:
+            key = (endpoint, method, response.status_code)
+            _requests[key] = _requests.get(key, 0) + 1
+        return response
@@ -0,0 +1,129 @@
+"""Single-runner execution of scheduled jobs.
+
+Every worker/dyno may run the scheduler, but a job only runs in the process
+that wins its JobLease row. Polls read the lease first and stop there while
+the job is not due. Otherwise the lease is taken with one conditional
+UPDATE, or an INSERT the first time, so it works the same on SQLite and
+PostgreSQL without advisory locks. After a run the lease stays blocked until
+`next_run_at`, so staggered schedulers in different processes do not each
+run the job once per interval.
+
+Each run that wins the lease is recorded in JobRun with its duration and the
+numbers the job returned. Runs older than JOB_RUN_RETENTION_DAYS are deleted
+as the job runs again.
+"""
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from models import db, JobLease, JobRun
+
+# Identifies this process in leases and run history.
+HOLDER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+# A run that has not finished after this long is presumed dead and its lease can be taken over.
+LEASE_TTL = timedelta(minutes=30)
+
+# Run history kept per job; a job on a one-minute interval records 1440 runs a day.
+JOB_RUN_RETENTION = timedelta(days=int(os.environ.get('JOB_RUN_RETENTION_DAYS', 14)))
+
+
+def acquire_lease(job_name, interval, force=False, now=None):
+    """Tries to take the job's lease. Returns True if this process should run the job now.
+
+    `force` ignores the schedule (for on-demand runs) but never a run that is still in progress.
+    """
+    now = now or datetime.utcnow()
+    lease = JobLease.__table__
+    current = db.session.execute(
+        select(lease.c.locked_until, lease.c.next_run_at).where(lease.c.job_name == job_name)
+    ).first()
+    if current is None:
+        try:
+            db.session.execute(lease.insert().values(
+                job_name=job_name, holder=HOLDER, locked_until=now + LEASE_TTL, next_run_at=now + interval
+            ))
+            db.session.commit()
+            return True
+        except IntegrityError:
+            # Another process created the row first.
+            db.session.rollback()
+            return False
+    if current.locked_until > now or (not force and current.next_run_at > now):
+        db.session.rollback()
+        return False
+
+    # Still conditional: another process may have taken the lease since the read.
+    conditions = [lease.c.job_name == job_name, lease.c.locked_until <= now]
+    if not force:
+        conditions.append(lease.c.next_run_at <= now)
+    result = db.session.execute(
+        lease.update().where(*conditions).values(holder=HOLDER, locked_until=now + LEASE_TTL)
+    )
+    if result.rowcount:
+        db.session.commit()
+        return True
+    db.session.rollback()
+    return False
+
+
+def release_lease(job_name, started_at, interval):
+    """Ends the run and blocks the job until one interval after this run started."""
+    lease = JobLease.__table__
+    db.session.execute(
+        lease.update()
+        .where(lease.c.job_name == job_name, lease.c.holder == HOLDER)
+        .values(locked_until=datetime.utcnow(), next_run_at=started_at + interval)
+    )
+    db.session.commit()
+
+
+def run_job(job_name, func, interval, trigger='schedule', force=False):
+    """Runs `func` if this process wins the lease and records the run.
+
+    `func` may return a dict with rows_scanned, messages_sent and messages_failed.
+    Returns the JobRun, or None when another process holds the lease.
+    """
+    started_at = datetime.utcnow()
+    if not acquire_lease(job_name, interval, force=force, now=started_at):
+        print(f"Skipping {job_name}: another process is running it or it is not due yet.")
+        return None
+
+    run = JobRun(job_name=job_name, holder=HOLDER, trigger=trigger, status='running', started_at=started_at)
+    db.session.add(run)
+    db.session.commit()
+
+    clock = time.perf_counter()
+    try:
+        stats = func() or {}
+        run.status = 'success'
+        run.rows_scanned = stats.get('rows_scanned')
+        run.messages_sent = stats.get('messages_sent')
+        run.messages_failed = stats.get('messages_failed')
+    except Exception as e:
+        db.session.rollback()
+        run.status = 'failed'
+        run.error = str(e)[:500]
+        print(f"Job {job_name} failed: {e}")
+    finally:
+        run.duration = time.perf_counter() - clock
+        run.finished_at = datetime.utcnow()
+        db.session.add(run)
+        db.session.execute(delete(JobRun).where(JobRun.job_name == job_name,
+                                                JobRun.started_at < started_at - JOB_RUN_RETENTION))
+        db.session.commit()
+        release_lease(job_name, started_at, interval)
+
+    print(f"Job {job_name} {run.status} in {run.duration:.2f}s "
+          f"(rows scanned: {run.rows_scanned}, sent: {run.messages_sent}, failed: {run.messages_failed}).")
+    return run
+
+
+def recent_runs(job_name=None, limit=20):
+    query = JobRun.query
+    if job_name:
+        query = query.filter_by(job_name=job_name)
+    return query.order_by(JobRun.started_at.desc()).limit(limit).all()
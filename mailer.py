@@ -0,0 +1,176 @@
+"""Outbound email dispatch.
+
+A transport delivers one message. SendGridTransport wraps a single shared
+SendGridAPIClient, and FakeTransport delivers nowhere, with configurable
+latency and failures for offline runs. The Dispatcher fans messages out
+over a bounded thread pool and retries transient failures with
+exponential backoff. It records the latency and outcome of every message.
+
+MAIL_TRANSPORT=fake switches the whole app to the fake transport.
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from sendgrid import SendGridAPIClient
+from sendgrid.helpers.mail import Mail
+
+
+@dataclass
+class Email:
+    to: list
+    subject: str
+    body: str
+    # Free-form label used in logs and results, e.g. the HOU the notice is for.
+    tag: str = ''
+
+
+@dataclass
+class DeliveryResult:
+    email: Email
+    ok: bool
+    attempts: int
+    latency: float  # seconds, including retries and backoff
+    status_code: int = None
+    error: str = None
+    permanent: bool = False  # failed with an error that retrying will not fix
+
+
+class TransientError(Exception):
+    """A failure worth retrying (timeouts, 429, 5xx)."""
+
+
+class PermanentError(Exception):
+    """A failure that will not go away on retry (bad address, 4xx)."""
+
+
+def _check_status(status_code, body=None):
+    if status_code == 429 or status_code >= 500:
+        raise TransientError(f"Provider returned {status_code}")
+    if status_code >= 400:
+        raise PermanentError(f"Provider returned {status_code}: {body}")
+
+
+class SendGridTransport:
+    def __init__(self, api_key, from_email, from_name=None):
+        # One client for the whole process instead of one per message.
+        self.client = SendGridAPIClient(api_key)
+        self.from_email = (from_email, from_name)
+
+    def send(self, email):
+        message = Mail(
+            from_email=self.from_email,
+            to_emails=email.to,
+            subject=email.subject,
+            plain_text_content=email.body
+        )
+        try:
+            response = self.client.send(message)
+        except Exception as e:
+            status_code = getattr(e, 'status_code', None)
+            if status_code is None:
+                raise TransientError(str(e))  # network error / timeout
+            _check_status(status_code, getattr(e, 'body', None))
+            raise
+        _check_status(response.status_code)
+        return response.status_code
+
+
+class FakeTransport:
+    """Delivers nothing; sleeps `latency` seconds and fails `failure_rate` of attempts."""
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.sent = []
+        self.attempts = 0
+        self.lock = threading.Lock()
+
+    def send(self, email):
+        with self.lock:
+            self.attempts += 1
+            fail = self.random.random() < self.failure_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise TransientError("Simulated provider failure")
+        with self.lock:
+            self.sent.append(email)
+        return 202
+
+
+class Dispatcher:
+    def __init__(self, transport, max_workers=8, max_attempts=4, base_delay=0.5, max_delay=10.0):
+        self.transport = transport
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def send(self, email):
+        """Sends one message, retrying transient failures. Never raises."""
+        started = time.perf_counter()
+        error = None
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                status_code = self.transport.send(email)
+                return DeliveryResult(email, True, attempt, time.perf_counter() - started, status_code)
+            except PermanentError as e:
+                return DeliveryResult(email, False, attempt, time.perf_counter() - started, error=str(e), permanent=True)
+            except Exception as e:
+                error = str(e)
+                if attempt < self.max_attempts:
+                    # Exponential backoff with full jitter.
+                    delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+                    time.sleep(random.uniform(0, delay))
+        return DeliveryResult(email, False, self.max_attempts, time.perf_counter() - started, error=error)
+
+    def dispatch(self, emails):
+        """Sends all messages concurrently; returns one DeliveryResult per message, in order."""
+        emails = list(emails)
+        if not emails:
+            return []
+        workers = min(self.max_workers, len(emails))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mail') as pool:
+            return list(pool.map(self.send, emails))
+
+
+def summarize(results):
+    latencies = sorted(result.latency for result in results)
+    sent = sum(1 for result in results if result.ok)
+    return {
+        "sent": sent,
+        "failed": len(results) - sent,
+        "retries": sum(result.attempts - 1 for result in results),
+        "max_latency": latencies[-1] if latencies else 0.0,
+        "p50_latency": latencies[len(latencies) // 2] if latencies else 0.0,
+    }
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_transport():
+    """Process-wide transport, chosen by MAIL_TRANSPORT ('sendgrid' by default, or 'fake')."""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            if os.environ.get('MAIL_TRANSPORT', 'sendgrid') == 'fake':
+                _transport = FakeTransport(latency=float(os.environ.get('FAKE_MAIL_LATENCY', 0)))
+            else:
+                _transport = SendGridTransport(
+                    os.environ.get('SENDGRID_API_KEY'),
+                    os.environ.get('SENDGRID_FROM_EMAIL'),
+                    os.environ.get('SENDGRID_FROM_NAME'),
+                )
+        return _transport
+
+def get_dispatcher():
+    return Dispatcher(
+        get_transport(),
+        max_workers=int(os.environ.get('MAIL_MAX_WORKERS', 8)),
+        max_attempts=int(os.environ.get('MAIL_MAX_ATTEMPTS', 4)),
+    )
@@ -0,0 +1,36 @@
+"""rate limit counter
+
+Revision ID: a8f77db6e8d3
+Revises: 8e31ab8bc4a0
+Create Date: 2026-10-17 19:12:08.540117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8f77db6e8d3'
+down_revision = '8e31ab8bc4a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The table is not part of db.metadata: ratelimit.SQLStorage reads and writes it directly.
+    # Only PostgreSQL deployments keep the counters in the app database; on SQLite they live in
+    # instance/ratelimit.db, which the storage sets up itself.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.create_table('rate_limit_counter',
+    sa.Column('key', sa.String(length=255), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('expires_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_table('rate_limit_counter')
@@ -0,0 +1,72 @@
+"""equipment search index
+
+Revision ID: bdd55a9fa642
+Revises: 161b678423d8
+Create Date: 2026-10-17 15:02:41.518306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bdd55a9fa642'
+down_revision = '161b678423d8'
+branch_labels = None
+depends_on = None
+
+
+# The search DDL as of this revision, copied from search.py so later changes there leave it alone.
+CREATE = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS equipment_search USING fts5("
+        "name, codes, make, parameters, description, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    ],
+    'postgresql': [
+        "CREATE TABLE IF NOT EXISTS equipment_search ("
+        "equipment_id INTEGER PRIMARY KEY, document TSVECTOR NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_equipment_search_document ON equipment_search USING GIN (document)",
+    ],
+}
+
+POPULATE = {
+    'sqlite': """
+        INSERT INTO equipment_search (rowid, name, codes, make, parameters, description)
+        SELECT e.id,
+               e.name,
+               coalesce(e.new_id_number, '') || ' ' || coalesce(e.serial_number, ''),
+               coalesce(e.manufacturer, '') || ' ' || coalesce(e.model, ''),
+               coalesce((SELECT group_concat(p.parameter_name || ' ' || p.parameter_value, ' ')
+                         FROM equipment_parameter p WHERE p.equipment_id = e.id), ''),
+               coalesce(e.description, '')
+        FROM equipment e
+    """,
+    'postgresql': """
+        INSERT INTO equipment_search (equipment_id, document)
+        SELECT e.id,
+               setweight(to_tsvector('simple', e.name || ' ' || coalesce(e.new_id_number, '')
+                                               || ' ' || coalesce(e.serial_number, '')), 'A')
+               || setweight(to_tsvector('simple', coalesce(e.manufacturer, '') || ' ' || coalesce(e.model, '')), 'B')
+               || setweight(to_tsvector('simple', coalesce((
+                      SELECT string_agg(p.parameter_name || ' ' || p.parameter_value, ' ')
+                      FROM equipment_parameter p WHERE p.equipment_id = e.id), '')), 'C')
+               || setweight(to_tsvector('simple', coalesce(e.description, '')), 'D')
+        FROM equipment e
+    """,
+}
+
+
+def upgrade():
+    # FTS5 table on SQLite, tsvector + GIN on PostgreSQL; nothing elsewhere.
+    dialect = op.get_bind().dialect.name
+    if dialect not in CREATE:
+        return
+    for statement in CREATE[dialect]:
+        op.execute(statement)
+    op.execute(POPULATE[dialect])
+
+
+def downgrade():
+    if op.get_bind().dialect.name in CREATE:
+        op.execute("DROP TABLE IF EXISTS equipment_search")
@@ -1,12 +1,23 @@
-from datetime import datetime
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import event
-from werkzeug.security import generate_password_hash, check_password_hash
+from itertools import chain
+from sqlalchemy import event, case, select, inspect, null, literal, func, or_, Date, DateTime, Integer, String
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import joinedload, selectinload
+from passwords import hash_password, needs_rehash, verify_password
 from dateutil.relativedelta import relativedelta
 from flask_login import UserMixin
 from extensions import db
 
 class User(UserMixin, db.Model):
+    __table_args__ = (
+        # Covers "emails of every admin" without touching the table.
+        db.Index('ix_user_roles_email', 'roles', 'email'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(150), unique=True, nullable=False)
     email = db.Column(db.String(150), unique=True, nullable=False)
@@ -19,19 +30,57 @@ class User(UserMixin, db.Model):
     unit = db.relationship('Unit', foreign_keys=[unit_id], backref='users')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Verifies `password`; on success an outdated hash is replaced (the caller commits)."""
+        if not verify_password(self.password_hash, password):
+            return False
+        if needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
+
+    @classmethod
+    def find_by_login(cls, login):
+        """The user whose username or email matches `login`, ignoring case, in one indexed query.
+
+        If only the case tells two accounts apart, the exact match wins.
+        """
+        if not isinstance(login, str) or not login.strip():
+            return None
+        login = login.strip()
+        # lower() on both sides, so the database's case folding is used throughout
+        return cls.query.filter(
+            or_(func.lower(cls.username) == func.lower(login), func.lower(cls.email) == func.lower(login))
+        ).order_by(
+            case((or_(cls.username == login, cls.email == login), 0), else_=1), cls.id
+        ).first()
+
+    @classmethod
+    def login_taken(cls, username, email):
+        """True if another account already uses `username` or `email`, ignoring case."""
+        return db.session.execute(select(
+            select(cls.id).where(or_(func.lower(cls.username) == func.lower(username),
+                                     func.lower(cls.email) == func.lower(email))).exists()
+        )).scalar()
 
     def __repr__(self):
         return f'<User {self.username}>'
 
+# Case-insensitive lookups for login and registration
+db.Index('ix_user_lower_username', func.lower(User.username))
+db.Index('ix_user_lower_email', func.lower(User.email))
+
 class Unit(db.Model):
+    __table_args__ = (
+        # Units of a branch, and the "unit name already exists in branch" check.
+        db.Index('ix_unit_branch_id_name', 'branch_id', 'name'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, unique=False)
     branch_id = db.Column(db.Integer, db.ForeignKey('branch.id'), nullable=False)
-    hou_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    hou_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
 
     hou = db.relationship('User', foreign_keys=[hou_id], backref=db.backref('headed_units', lazy=True))
 
@@ -46,7 +95,111 @@ class Branch(db.Model):
 
     units = db.relationship('Unit', backref='branch', lazy=True)
 
+# Named service frequencies and their intervals. Anything else of the form
+# "Every <n> days/weeks/months/years" is understood as a custom interval.
+FREQUENCY_INTERVALS = {
+    'Annual': relativedelta(years=1),
+    'Semi-Annual': relativedelta(months=6),
+    'Quarterly': relativedelta(months=3),
+    'Monthly': relativedelta(months=1),
+}
+
+SERVICE_FREQUENCIES = tuple(FREQUENCY_INTERVALS)
+
+CUSTOM_FREQUENCY = re.compile(r'^\s*every\s+(\d+)\s+(day|week|month|year)s?\s*$', re.IGNORECASE)
+
+# Longest custom interval accepted, per unit: ten years in each.
+CUSTOM_FREQUENCY_LIMITS = {'day': 3660, 'week': 522, 'month': 120, 'year': 10}
+
+def frequency_error(frequency):
+    """Validation message for a custom frequency longer than CUSTOM_FREQUENCY_LIMITS, else None."""
+    match = CUSTOM_FREQUENCY.match(frequency) if isinstance(frequency, str) else None
+    if match and int(match.group(1)) > CUSTOM_FREQUENCY_LIMITS[match.group(2).lower()]:
+        limit = CUSTOM_FREQUENCY_LIMITS[match.group(2).lower()]
+        return f"A custom frequency can be at most every {limit} {match.group(2).lower()}s."
+    return None
+
+@lru_cache(maxsize=256)
+def frequency_interval(frequency):
+    """relativedelta for a named or "Every N units" frequency, or None if it is not recognised."""
+    if frequency in FREQUENCY_INTERVALS:
+        return FREQUENCY_INTERVALS[frequency]
+    match = CUSTOM_FREQUENCY.match(frequency or '')
+    if not match or int(match.group(1)) == 0 or frequency_error(frequency):
+        return None
+    return relativedelta(**{match.group(2).lower() + 's': int(match.group(1))})
+
+def next_service_date(service_date, frequency):
+    """Date the next calibration/maintenance falls due, or None for an unknown frequency."""
+    interval = frequency_interval(frequency)
+    if not service_date or interval is None:
+        return None
+    try:
+        return service_date + interval
+    except (ValueError, OverflowError):
+        # Past date.max (year 9999); there is no next date to track.
+        return None
+
+def next_service_date_expression(frequency_column, service_date, frequencies=SERVICE_FREQUENCIES):
+    """SQL twin of next_service_date() for one service date shared by every row.
+
+    Pass the custom frequencies the rows use in `frequencies`; rows with any other value get NULL.
+    """
+    whens = [(frequency_column == frequency, next_service_date(service_date, frequency))
+             for frequency in frequencies if frequency_interval(frequency) is not None]
+    return case(*whens, else_=None) if whens else null()
+
+# Equipment is "Due Soon" when its next service falls within this many days.
+DUE_SOON_DAYS = 30
+
+def due_status(next_date, unknown_label):
+    if not next_date:
+        return unknown_label
+
+    today = datetime.utcnow().date()
+    days_left = (next_date - today).days
+    if days_left < 0:
+        return 'Over Due'
+    elif days_left <= DUE_SOON_DAYS:
+        return 'Due Soon'
+    else:
+        return 'OK'
+
+def due_status_expression(column, unknown_label):
+    """SQL twin of due_status(), for selecting or grouping by status."""
+    today = datetime.utcnow().date()
+    return case(
+        (column.is_(None), unknown_label),
+        (column < today, 'Over Due'),
+        (column <= today + timedelta(days=DUE_SOON_DAYS), 'Due Soon'),
+        else_='OK',
+    )
+
+def due_status_condition(column, status):
+    """Filter for one status written as a plain range on the date column, so it can use an index.
+
+    Returns None for an unrecognised status. Any label starting with 'Unknown' matches missing dates.
+    """
+    today = datetime.utcnow().date()
+    if status == 'Over Due':
+        return column < today
+    if status == 'Due Soon':
+        return column.between(today, today + timedelta(days=DUE_SOON_DAYS))
+    if status == 'OK':
+        return column > today + timedelta(days=DUE_SOON_DAYS)
+    if status.startswith('Unknown'):
+        return column.is_(None)
+    return None
+
 class Equipment(db.Model):
+    __table_args__ = (
+        # "Everything due in unit/branch X" is a range scan on these.
+        db.Index('ix_equipment_unit_id_next_calibration_date', 'unit_id', 'next_calibration_date'),
+        db.Index('ix_equipment_unit_id_next_maintenance_date', 'unit_id', 'next_maintenance_date'),
+        # Keyset pagination of the dashboard in its default (name, id) order.
+        db.Index('ix_equipment_name_id', 'name', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), nullable=False)
     manufacturer = db.Column(db.String(150))
@@ -59,66 +212,53 @@ class Equipment(db.Model):
 
     calibration_frequency = db.Column(db.String(100), default='Annual')
     calibration_date = db.Column(db.Date)
-    next_calibration_date = db.Column(db.Date)
+    next_calibration_date = db.Column(db.Date, index=True)
 
     maintenance_frequency = db.Column(db.String(100), default='Annual')
     maintenance_date = db.Column(db.Date)
-    next_maintenance_date = db.Column(db.Date)
+    next_maintenance_date = db.Column(db.Date, index=True)
 
     description = db.Column(db.String(500))
     quantity = db.Column(db.Integer, default=1)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def set_next_calibration_date(self):
-        if self.calibration_date and self.calibration_frequency == 'Annual':
-            self.next_calibration_date = self.calibration_date + relativedelta(years=1)
-        elif self.calibration_date and self.calibration_frequency == 'Semi-Annual':
-            self.next_calibration_date = self.calibration_date + relativedelta(months=6)
-        elif self.calibration_date and self.calibration_frequency == 'Quarterly':
-            self.next_calibration_date = self.calibration_date + relativedelta(months=3)
-        elif self.calibration_date and self.calibration_frequency == 'Monthly':
-            self.next_calibration_date = self.calibration_date + relativedelta(months=1)
-        else:
-            self.next_calibration_date = None
+        self.next_calibration_date = next_service_date(self.calibration_date, self.calibration_frequency)
 
     def set_next_maintenance_date(self):
-        if self.maintenance_date and self.maintenance_frequency == 'Annual':
-            self.next_maintenance_date = self.maintenance_date + relativedelta(years=1)
-        elif self.maintenance_date and self.maintenance_frequency == 'Semi-Annual':
-            self.next_maintenance_date = self.maintenance_date + relativedelta(months=6)
-        elif self.maintenance_date and self.maintenance_frequency == 'Quarterly':
-            self.next_maintenance_date = self.maintenance_date + relativedelta(months=3)
-        elif self.maintenance_date and self.maintenance_frequency == 'Monthly':
-            self.next_maintenance_date = self.maintenance_date + relativedelta(months=1)
-        else:
-            self.next_maintenance_date = None
-
-    @property
+        self.next_maintenance_date = next_service_date(self.maintenance_date, self.maintenance_frequency)
+
+    @hybrid_property
     def cal_status(self):
-        if not self.next_calibration_date:
-            return 'Unknown C'
-
-        today = datetime.utcnow().date()
-        days_left = (self.next_calibration_date - today).days
-        if days_left < 0:
-            return 'Over Due'
-        elif days_left <= 30:
-            return 'Due Soon'
-        else:
-            return 'OK'
-
-    @property
+        return due_status(self.next_calibration_date, 'Unknown C')
+
+    @cal_status.expression
+    def cal_status(cls):
+        return due_status_expression(cls.next_calibration_date, 'Unknown C')
+
+    @hybrid_property
     def mnt_status(self):
-        if not self.next_maintenance_date:
-            return 'Unknown M'
-        today = datetime.utcnow().date()
-        days_left = (self.next_maintenance_date - today).days
-        if days_left < 0:
-            return 'Over Due'
-        elif days_left <= 30:
-            return 'Due Soon'
-        else:
-            return 'OK'
+        return due_status(self.next_maintenance_date, 'Unknown M')
+
+    @mnt_status.expression
+    def mnt_status(cls):
+        return due_status_expression(cls.next_maintenance_date, 'Unknown M')
+
+    @classmethod
+    def cal_status_is(cls, status):
+        return due_status_condition(cls.next_calibration_date, status)
+
+    @classmethod
+    def mnt_status_is(cls, status):
+        return due_status_condition(cls.next_maintenance_date, status)
+
+    @classmethod
+    def serialization_options(cls):
+        """Loader options that fetch everything to_dict() touches in two queries, whatever the row count."""
+        return (
+            joinedload(cls.unit).joinedload(Unit.branch),
+            selectinload(cls.parameters),
+        )
 
     def to_dict(self):
         return {
@@ -159,11 +299,21 @@ def set_dates_before_insert(mapper, connection, target):
 
 @event.listens_for(Equipment, 'before_update')
 def set_dates_before_update(mapper, connection, target):
-    target.set_next_calibration_date()
-    target.set_next_maintenance_date()
+    # Only recompute a next date when its service date or frequency changed.
+    state = inspect(target)
+    if (state.attrs.calibration_date.history.has_changes()
+            or state.attrs.calibration_frequency.history.has_changes()):
+        target.set_next_calibration_date()
+    if (state.attrs.maintenance_date.history.has_changes()
+            or state.attrs.maintenance_frequency.history.has_changes()):
+        target.set_next_maintenance_date()
 
 
 class EquipmentParameter(db.Model):
+    __table_args__ = (
+        db.Index('ix_equipment_parameter_equipment_id_parameter_name', 'equipment_id', 'parameter_name'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     equipment_id = db.Column(db.Integer, db.ForeignKey('equipment.id'), nullable=False)
     parameter_name = db.Column(db.String(150), nullable=False)
@@ -173,3 +323,213 @@ class EquipmentParameter(db.Model):
 
     def __repr__(self):
         return f'<EquipmentParameter {self.parameter_name}: {self.parameter_value}>'
+
+
+class NotificationLedger(db.Model):
+    """Last due notice sent for each equipment and service type.
+
+    The notification job compares it with the current due date and status so
+    it only sends what is new, changed, escalated or due for a reminder.
+    """
+    __table_args__ = (
+        db.UniqueConstraint('equipment_id', 'service_type', name='uq_notification_ledger_equipment_id_service_type'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    equipment_id = db.Column(db.Integer, db.ForeignKey('equipment.id'), nullable=False)
+    service_type = db.Column(db.String(20), nullable=False)  # 'maintenance' or 'calibration'
+    due_date = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # 'Due Soon' or 'Over Due' when sent
+    last_sent_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_count = db.Column(db.Integer, nullable=False, default=1)
+
+    def __repr__(self):
+        return f'<NotificationLedger {self.equipment_id} {self.service_type} {self.due_date}>'
+
+
+
+class JobLease(db.Model):
+    """Database lease that lets exactly one process run a scheduled job per interval."""
+    job_name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(100))
+    locked_until = db.Column(db.DateTime, nullable=False)  # a run is in progress until then
+    next_run_at = db.Column(db.DateTime, nullable=False)   # earliest start of the next scheduled run
+
+    def __repr__(self):
+        return f'<JobLease {self.job_name} held by {self.holder}>'
+
+
+class JobRun(db.Model):
+    """One execution of a scheduled job, with the numbers it reported."""
+    __table_args__ = (
+        db.Index('ix_job_run_job_name_started_at', 'job_name', 'started_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_name = db.Column(db.String(50), nullable=False)
+    holder = db.Column(db.String(100), nullable=False)
+    trigger = db.Column(db.String(20), nullable=False)  # 'schedule' or 'manual'
+    status = db.Column(db.String(20), nullable=False)   # 'running', 'success' or 'failed'
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    duration = db.Column(db.Float)  # seconds
+    rows_scanned = db.Column(db.Integer)
+    messages_sent = db.Column(db.Integer)
+    messages_failed = db.Column(db.Integer)
+    error = db.Column(db.String(500))
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "job_name": self.job_name,
+            "holder": self.holder,
+            "trigger": self.trigger,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "duration": self.duration,
+            "rows_scanned": self.rows_scanned,
+            "messages_sent": self.messages_sent,
+            "messages_failed": self.messages_failed,
+            "error": self.error,
+        }
+
+    def __repr__(self):
+        return f'<JobRun {self.job_name} {self.status}>'
+
+class OutboxMessage(db.Model):
+    """An outbound email, written in the sender's transaction and delivered later by the deliver_outbox job."""
+    __table_args__ = (
+        db.Index('ix_outbox_message_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipients = db.Column(db.JSON, nullable=False)  # list of addresses
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    tag = db.Column(db.String(255))
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'sent' or 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    last_error = db.Column(db.String(500))
+    # Seconds the last delivery run spent on this message, provider retries and backoff included
+    last_latency = db.Column(db.Float)
+    provider_attempts = db.Column(db.Integer, nullable=False, default=0)  # provider calls over all runs
+    # [[equipment_id, service_type, due date], ...] a due notification recorded in the NotificationLedger
+    notices = db.Column(db.JSON)
+
+    def __repr__(self):
+        return f'<OutboxMessage {self.id} {self.status} {self.subject}>'
+
+
+class ServiceEvent(db.Model):
+    """One calibration or maintenance, appended whenever a service is recorded and never changed.
+
+    Unit and branch are copied from the equipment at the time, so history
+    stays put when equipment moves. equipment_id and actor_id are not
+    foreign keys, because the history outlives deleted equipment and users.
+    """
+    __table_args__ = (
+        # "What did branch X do between these dates" and "history of this equipment".
+        db.Index('ix_service_event_branch_id_service_date', 'branch_id', 'service_date'),
+        db.Index('ix_service_event_equipment_id_service_date', 'equipment_id', 'service_date'),
+        # Fleet-wide throughput, counted straight from the index.
+        db.Index('ix_service_event_service_date_kind', 'service_date', 'kind'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    equipment_id = db.Column(db.Integer, nullable=False)
+    unit_id = db.Column(db.Integer, db.ForeignKey('unit.id'), nullable=False)
+    branch_id = db.Column(db.Integer, db.ForeignKey('branch.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'calibration' or 'maintenance'
+    service_date = db.Column(db.Date, nullable=False)
+    actor_id = db.Column(db.Integer)
+    actor_name = db.Column(db.String(150))
+    source = db.Column(db.String(20), nullable=False)  # 'single', 'bulk', 'import', 'backfill' or 'synthetic'
+    recorded_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "equipment_id": self.equipment_id,
+            "unit_id": self.unit_id,
+            "branch_id": self.branch_id,
+            "kind": self.kind,
+            "service_date": str(self.service_date),
+            "actor_id": self.actor_id,
+            "actor_name": self.actor_name,
+            "source": self.source,
+            "recorded_at": self.recorded_at.isoformat(),
+        }
+
+    def __repr__(self):
+        return f'<ServiceEvent {self.kind} of {self.equipment_id} on {self.service_date}>'
+
+@event.listens_for(ServiceEvent, 'before_update')
+@event.listens_for(ServiceEvent, 'before_delete')
+def keep_service_events_append_only(mapper, connection, target):
+    raise ValueError("Service events are append-only.")
+
+def record_service_events(connection, equipment_ids, kind, service_date=None, actor=None, source='bulk'):
+    """Appends one event per equipment with a single INSERT ... SELECT.
+
+    Without `service_date` each equipment's own calibration/maintenance date
+    is used, and equipment without one are skipped.
+    """
+    equipment_ids = list(equipment_ids)
+    if not equipment_ids:
+        return
+    date_column = Equipment.calibration_date if kind == 'calibration' else Equipment.maintenance_date
+    date_value = literal(service_date, Date) if service_date else date_column
+    query = (
+        select(Equipment.id, Equipment.unit_id, Unit.branch_id, literal(kind), date_value,
+               literal(actor.id if actor else None, Integer), literal(actor.username if actor else None, String),
+               literal(source), literal(datetime.utcnow(), DateTime))
+        .join(Unit, Equipment.unit_id == Unit.id)
+        .where(Equipment.id.in_(equipment_ids))
+    )
+    if not service_date:
+        query = query.where(date_column.isnot(None))
+    table = ServiceEvent.__table__
+    connection.execute(table.insert().from_select(
+        ['equipment_id', 'unit_id', 'branch_id', 'kind', 'service_date',
+         'actor_id', 'actor_name', 'source', 'recorded_at'],
+        query,
+    ))
+
+# Tables whose changes are counted in ChangeVersion.
+VERSIONED_TABLES = ('branch', 'unit', 'user', 'equipment', 'equipment_parameter')
+
+class ChangeVersion(db.Model):
+    """Per-table counter bumped by every write; the list APIs derive their ETags from it."""
+    table_name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ChangeVersion {self.table_name}: {self.version}>'
+
+def bump_change_versions(connection, table_names):
+    """Increments the versions of table_names. Bulk/Core writes that bypass the ORM must call this."""
+    names = sorted(set(table_names) & set(VERSIONED_TABLES))
+    if not names:
+        return
+    table = ChangeVersion.__table__
+    result = connection.execute(
+        table.update().where(table.c.table_name.in_(names)).values(version=table.c.version + 1)
+    )
+    if result.rowcount < len(names):
+        existing = set(connection.execute(select(table.c.table_name).where(table.c.table_name.in_(names))).scalars())
+        connection.execute(table.insert(), [{"table_name": name, "version": 1} for name in names if name not in existing])
+
+def get_change_versions(table_names):
+    table = ChangeVersion.__table__
+    rows = db.session.execute(select(table.c.table_name, table.c.version).where(table.c.table_name.in_(table_names)))
+    versions = dict(rows.all())
+    return {name: versions.get(name, 0) for name in table_names}
+
+@event.listens_for(Session, 'after_flush')
+def bump_versions_after_flush(session, flush_context):
+    changed = chain(session.new, session.dirty, session.deleted)
+    bump_change_versions(session.connection(), {obj.__table__.name for obj in changed if hasattr(obj, '__table__')})
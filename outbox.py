@@ -0,0 +1,154 @@
+"""Transactional email outbox.
+
+Request handlers and jobs call enqueue(), which adds an OutboxMessage to the
+current session. The message is committed, or rolled back, together with
+the work that produced it, and the request never waits for the provider.
+
+deliver_outbox() runs as the `deliver_outbox` scheduled job. It takes due
+messages in batches and sends each batch through the shared Dispatcher.
+That keeps every outbound mail on one pipeline with bounded concurrency and
+in-run retries. A message that still fails is retried by later runs with
+exponential backoff, until OUTBOX_MAX_ATTEMPTS. Permanent provider errors
+fail it at once. Delivery is at least once: if a run dies between the
+provider accepting a batch and the commit, that batch is sent again.
+
+Due notifications are recorded in the NotificationLedger when they are
+queued. When such a message is given up on, its ledger entries are deleted
+in the same transaction, so the next due_notifications run sends them again.
+
+Each message keeps the latency and provider calls of its last delivery run;
+/metrics reports them per status through delivery_latency().
+
+Bodies can carry password-reset links, so a message's body is blanked as
+soon as it is sent or given up on, and sent messages are deleted after
+OUTBOX_RETENTION_HOURS.
+"""
+import os
+from datetime import date, datetime, timedelta
+from sqlalchemy import bindparam, delete, func, insert, select
+from mailer import Email, get_dispatcher
+from models import db, NotificationLedger, OutboxMessage
+
+BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 50))
+# Messages sent per run at most, so a backlog cannot hold the job lease for long.
+MAX_PER_RUN = int(os.environ.get('OUTBOX_MAX_PER_RUN', 1000))
+MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 8))
+RETRY_BASE_DELAY = timedelta(minutes=1)
+RETRY_MAX_DELAY = timedelta(hours=2)
+# Sent messages are kept this long for troubleshooting: about the lifetime of a password-reset link.
+RETENTION = timedelta(hours=int(os.environ.get('OUTBOX_RETENTION_HOURS', 1)))
+
+
+def _message_values(email, notices):
+    return {
+        "recipients": list(email.to), "subject": email.subject, "body": email.body, "tag": email.tag,
+        "notices": [[equipment_id, service_type, due_date.isoformat()]
+                    for equipment_id, service_type, due_date in notices] if notices else None,
+    }
+
+
+def enqueue(email, notices=None):
+    """Adds `email` to the outbox in the current session; the caller commits.
+
+    `notices` lists the (equipment_id, service_type, due_date) ledger entries the email stands for.
+    """
+    message = OutboxMessage(**_message_values(email, notices))
+    db.session.add(message)
+    return message
+
+
+def enqueue_many(messages):
+    """Writes (email, notices) pairs to the outbox with one executemany INSERT; the caller commits."""
+    rows = [_message_values(email, notices) for email, notices in messages]
+    if rows:
+        db.session.execute(insert(OutboxMessage), rows)
+
+
+def _forget_notices(notices):
+    """Deletes the ledger entries of undelivered notices, unless a newer due date has been noticed since."""
+    ledger = NotificationLedger.__table__
+    db.session.execute(
+        ledger.delete().where(ledger.c.equipment_id == bindparam('b_equipment_id'),
+                              ledger.c.service_type == bindparam('b_service_type'),
+                              ledger.c.due_date == bindparam('b_due_date')),
+        [{"b_equipment_id": equipment_id, "b_service_type": service_type, "b_due_date": date.fromisoformat(due_date)}
+         for equipment_id, service_type, due_date in notices]
+    )
+
+
+def retry_delay(attempts):
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempts - 1))
+
+
+def deliver_outbox():
+    """Sends due outbox messages; returns the counts recorded in the job run."""
+    dispatcher = get_dispatcher()
+    sent = failed = scanned = 0
+    while scanned < MAX_PER_RUN:
+        now = datetime.utcnow()
+        messages = db.session.execute(
+            select(OutboxMessage)
+            .where(OutboxMessage.status == 'pending', OutboxMessage.next_attempt_at <= now)
+            .order_by(OutboxMessage.id)
+            .limit(min(BATCH_SIZE, MAX_PER_RUN - scanned))
+        ).scalars().all()
+        if not messages:
+            break
+        scanned += len(messages)
+
+        results = dispatcher.dispatch(
+            Email(to=message.recipients, subject=message.subject, body=message.body, tag=message.tag)
+            for message in messages
+        )
+        now = datetime.utcnow()
+        forgotten = []
+        for message, result in zip(messages, results):
+            message.attempts += 1
+            message.provider_attempts += result.attempts
+            message.last_latency = result.latency
+            if result.ok:
+                message.status = 'sent'
+                message.sent_at = now
+                message.last_error = None
+                message.body = ''
+                sent += 1
+                continue
+            message.last_error = (result.error or '')[:500]
+            if result.permanent or message.attempts >= MAX_ATTEMPTS:
+                message.status = 'failed'
+                message.body = ''
+                failed += 1
+                print(f"Giving up on outbox message {message.id} ({message.tag}) after "
+                      f"{message.attempts} attempt(s): {result.error}")
+                forgotten += message.notices or []
+            else:
+                message.next_attempt_at = now + retry_delay(message.attempts)
+        if forgotten:
+            _forget_notices(forgotten)
+        db.session.commit()
+
+    pruned = db.session.execute(
+        delete(OutboxMessage).where(OutboxMessage.status == 'sent',
+                                    OutboxMessage.sent_at < datetime.utcnow() - RETENTION)
+    ).rowcount
+    db.session.commit()
+    if scanned or pruned:
+        print(f"Outbox: {sent} sent, {failed} failed for good, {scanned - sent - failed} to retry, "
+              f"{pruned} old messages pruned.")
+    return {"rows_scanned": scanned, "messages_sent": sent, "messages_failed": failed}
+
+
+def outbox_counts():
+    """{status: number of messages}."""
+    return dict(db.session.execute(
+        select(OutboxMessage.status, func.count()).group_by(OutboxMessage.status)
+    ).all())
+
+
+def delivery_latency():
+    """{status: (average, maximum) last_latency in seconds} over the messages still in the outbox."""
+    return {status: (average, maximum) for status, average, maximum in db.session.execute(
+        select(OutboxMessage.status, func.avg(OutboxMessage.last_latency), func.max(OutboxMessage.last_latency))
+        .where(OutboxMessage.last_latency.is_not(None))
+        .group_by(OutboxMessage.status)
+    )}
@@ -0,0 +1,44 @@
+"""Password hashing at a configurable cost.
+
+PASSWORD_HASH_METHOD takes any werkzeug method string, e.g. the default
+"scrypt:32768:8:1" (about 130ms per hash here) or "pbkdf2:sha256:600000".
+New hashes use it. A user whose stored hash was made with another method is
+rehashed on their next successful login, so changing the setting moves
+everyone over without a reset.
+
+Logins for unknown accounts check the password against a dummy hash of the
+same cost. Every attempt therefore takes about the same time, whether or
+not the account exists.
+"""
+import os
+from functools import lru_cache
+from werkzeug.security import generate_password_hash, check_password_hash
+
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+
+
+def hash_password(password):
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+
+@lru_cache(maxsize=1)
+def _current_method():
+    # werkzeug fills in defaults ("scrypt" -> "scrypt:32768:8:1"); compare against what it writes.
+    return _dummy_hash().split('$', 1)[0]
+
+
+@lru_cache(maxsize=1)
+def _dummy_hash():
+    return hash_password(os.urandom(16).hex())
+
+
+def needs_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != _current_method()
+
+
+def verify_password(password_hash, password):
+    """Checks `password` against `password_hash`, or against a dummy hash when there is none."""
+    if password_hash is None:
+        check_password_hash(_dummy_hash(), password or '')
+        return False
+    return check_password_hash(password_hash, password or '')
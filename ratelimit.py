@@ -0,0 +1,135 @@
+"""Rate-limit counters shared by every worker, kept in a SQL table.
+
+Flask-Limiter's default memory:// storage gives each gunicorn worker and
+dyno its own counters, and they reset on restart. SQLStorage registers the
+`sql+<database url>` storage schemes with the limits library, for example
+`sql+sqlite:////app/instance/ratelimit.db` or `sql+postgresql://...`.
+
+Each hit is a single INSERT ... ON CONFLICT DO UPDATE ... RETURNING. It
+starts a new window when the stored one has expired and otherwise adds to
+the count, so concurrent workers never lose increments. The storage uses
+its own engine and autocommits, so it never touches the request's
+transaction. Counters are disposable, so commits skip the disk flush:
+synchronous=OFF with WAL on SQLite and synchronous_commit=off on
+PostgreSQL. benchmarks/rate_limit.py measures the cost per hit.
+
+On PostgreSQL the counter table lives in the app database and is created
+by the migrations. A SQLite counter file is created, table included, on the
+first hit, so commands that never reach a limit leave no file behind.
+"""
+import random
+import threading
+import time
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, create_engine, delete, event, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from limits.storage import Storage
+
+TABLE_NAME = 'rate_limit_counter'
+
+# Expired rows are deleted on roughly one hit in this many.
+PRUNE_EVERY = 1000
+
+metadata = MetaData()
+counters = Table(
+    TABLE_NAME, metadata,
+    Column('key', String(255), primary_key=True),
+    Column('count', Integer, nullable=False),
+    Column('expires_at', Float, nullable=False),  # Unix time
+)
+
+# Same SQL on SQLite and PostgreSQL. SQLAlchemy cannot cache the compiled form of its
+# ON CONFLICT construct, so the upsert is written as text, which compiles once.
+_UPSERT = text(f"""
+    INSERT INTO {TABLE_NAME} (key, count, expires_at) VALUES (:key, :amount, :expires_at)
+    ON CONFLICT (key) DO UPDATE SET
+        count = CASE WHEN {TABLE_NAME}.expires_at <= :now THEN :amount ELSE {TABLE_NAME}.count + :amount END,
+        expires_at = CASE WHEN {TABLE_NAME}.expires_at <= :now THEN :expires_at ELSE {TABLE_NAME}.expires_at END
+    RETURNING count
+""")
+
+
+def _tune_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=OFF")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+def _tune_postgresql(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("SET synchronous_commit TO OFF")
+    cursor.close()
+
+
+class SQLStorage(Storage):
+    """limits storage backed by the rate_limit_counter table; supports the fixed-window strategy."""
+
+    STORAGE_SCHEME = ['sql+sqlite', 'sql+postgresql', 'sql+postgresql+psycopg2']
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        # RATELIMIT_STORAGE_OPTIONS can size the pool.
+        pool = {name: options[name] for name in ('pool_size', 'max_overflow') if name in options}
+        self.engine = create_engine(uri[len('sql+'):], isolation_level='AUTOCOMMIT', **pool)
+        tune = _tune_sqlite if self.engine.dialect.name == 'sqlite' else _tune_postgresql
+        event.listen(self.engine, 'connect', tune)
+        self._table_ready = self.engine.dialect.name != 'sqlite'
+        self._table_lock = threading.Lock()
+
+    def _connect(self):
+        if not self._table_ready:
+            with self._table_lock:
+                if not self._table_ready:
+                    metadata.create_all(self.engine, checkfirst=True)
+                    self._table_ready = True
+        return self.engine.connect()
+
+    @property
+    def base_exceptions(self):
+        return SQLAlchemyError
+
+    def incr(self, key, expiry, amount=1):
+        now = time.time()
+        with self._connect() as connection:
+            count = connection.execute(_UPSERT, {
+                "key": key, "amount": amount, "now": now, "expires_at": now + expiry,
+            }).scalar_one()
+            if random.randrange(PRUNE_EVERY) == 0:
+                connection.execute(delete(counters).where(counters.c.expires_at <= now))
+        return count
+
+    def get(self, key):
+        with self._connect() as connection:
+            count = connection.execute(
+                select(counters.c.count).where(counters.c.key == key, counters.c.expires_at > time.time())
+            ).scalar()
+        return count or 0
+
+    def get_expiry(self, key):
+        with self._connect() as connection:
+            expires_at = connection.execute(
+                select(counters.c.expires_at).where(counters.c.key == key)
+            ).scalar()
+        return expires_at if expires_at is not None else time.time()
+
+    def check(self):
+        try:
+            with self._connect() as connection:
+                connection.execute(select(1))
+            return True
+        except SQLAlchemyError:
+            return False
+
+    def reset(self):
+        with self._connect() as connection:
+            return connection.execute(delete(counters)).rowcount
+
+    def clear(self, key):
+        with self._connect() as connection:
+            connection.execute(delete(counters).where(counters.c.key == key))
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    """Keeps Alembic autogenerate from dropping the counter table, which a migration creates outside db.metadata."""
+    return not (type_ == 'table' and reflected and compare_to is None and name == TABLE_NAME)
@@ -0,0 +1,97 @@
+"""Process-local cache of branches and units.
+
+Branches and units appear in most forms but change only through
+/create-branch and the admin role editor. Those write paths call
+invalidate() after they commit. Other workers notice the change through the
+change_version table, which they check at most once per
+REFERENCE_CACHE_TTL seconds. The check is a one-row query, and the cache is
+rebuilt only when the branch or unit version has moved.
+
+The cached objects are plain frozen snapshots, so templates can use them
+outside any session.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from flask import current_app
+from sqlalchemy import select
+from models import db, Branch, Unit, get_change_versions
+
+REFERENCE_TABLES = ('branch', 'unit')
+DEFAULT_TTL = 60
+
+
+@dataclass(frozen=True)
+class UnitRef:
+    id: int
+    name: str
+    branch_id: int
+    branch_name: str
+    hou_id: int
+
+
+@dataclass(frozen=True)
+class BranchRef:
+    id: int
+    name: str
+    address: str
+    units: tuple  # UnitRef, ordered by name
+
+
+@dataclass(frozen=True)
+class ReferenceData:
+    branches: tuple  # BranchRef, ordered by name
+    units: tuple  # UnitRef, ordered by name
+    versions: dict
+
+    def unit(self, unit_id):
+        return next((unit for unit in self.units if unit.id == unit_id), None)
+
+
+_data = None
+_checked_at = 0.0
+_lock = threading.Lock()
+stats = {"hits": 0, "checks": 0, "loads": 0}
+
+
+def _load(versions):
+    branch_rows = db.session.execute(
+        select(Branch.id, Branch.name, Branch.address).order_by(Branch.name)
+    ).all()
+    unit_rows = db.session.execute(
+        select(Unit.id, Unit.name, Unit.branch_id, Branch.name, Unit.hou_id)
+        .join(Branch, Unit.branch_id == Branch.id)
+        .order_by(Unit.name)
+    ).all()
+    units = tuple(UnitRef(*row) for row in unit_rows)
+    branches = tuple(
+        BranchRef(branch_id, name, address, tuple(unit for unit in units if unit.branch_id == branch_id))
+        for branch_id, name, address in branch_rows
+    )
+    return ReferenceData(branches, units, versions)
+
+
+def get_reference_data():
+    """Returns the current ReferenceData, reloading it only if branches or units changed."""
+    global _data, _checked_at
+    ttl = current_app.config.get('REFERENCE_CACHE_TTL', DEFAULT_TTL)
+    with _lock:
+        now = time.monotonic()
+        if _data is not None and now - _checked_at < ttl:
+            stats["hits"] += 1
+            return _data
+
+        stats["checks"] += 1
+        versions = get_change_versions(REFERENCE_TABLES)
+        if _data is None or _data.versions != versions:
+            stats["loads"] += 1
+            _data = _load(versions)
+        _checked_at = now
+        return _data
+
+
+def invalidate():
+    """Drops the cache; call after committing a change to branches or units."""
+    global _data
+    with _lock:
+        _data = None
@@ -1,19 +1,35 @@
-import time
-from apscheduler.schedulers.background import BackgroundScheduler
-from .app import app, send_due_maintenance_notifications # Import your app and the job function
+from apscheduler.schedulers.blocking import BlockingScheduler
+from app import app, SCHEDULED_JOBS
+from jobs import run_job
 
 def start_scheduler():
-    """Initializes and starts the background scheduler."""
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(
-        func=send_due_maintenance_notifications, 
-        trigger="interval", 
-        hours=4
-    )
-    scheduler.start()
+    """Runs every job in SCHEDULED_JOBS on its interval, in the foreground.
+
+    Any number of processes may run this; the job lease makes sure each job
+    runs in only one of them per interval.
+    """
+    scheduler = BlockingScheduler()
+    for name, (func, interval) in SCHEDULED_JOBS.items():
+        scheduler.add_job(
+            func=run_scheduled_job,
+            args=[name],
+            trigger="interval",
+            # Wake up eight times per interval; the lease decides whether it is actually due. A run
+            # can then start at most an eighth of an interval late, instead of skipping a cycle when a
+            # wake-up lands just before next_run_at. Polls that find the job not due are one SELECT.
+            seconds=max(5, int(interval.total_seconds() // 8)),
+            id=name,
+            max_instances=1,
+            coalesce=True
+        )
     print("APScheduler started for production...")
+    scheduler.start()
 
-if __name__ == "__main__":
+def run_scheduled_job(name):
     # The app context is crucial for the job to access the database
     with app.app_context():
-        start_scheduler()
\ No newline at end of file
+        func, interval = SCHEDULED_JOBS[name]
+        run_job(name, func, interval)
+
+if __name__ == "__main__":
+    start_scheduler()
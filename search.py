@@ -0,0 +1,169 @@
+"""Full-text search over equipment and their parameters.
+
+Each equipment has one row in `equipment_search`. On SQLite this is an FTS5
+virtual table whose rowid is the equipment id. On PostgreSQL it is a plain
+table with a weighted tsvector and a GIN index on it. Name and ID numbers
+rank highest, then manufacturer/model, then parameters, then description.
+
+The rows are rebuilt in SQL, inside the writing transaction, for every
+equipment touched by an ORM flush. Core/bulk writes must call
+reindex_equipment() themselves, like bump_change_versions().
+`flask rebuild-search-index` rebuilds everything.
+
+Other databases have no index. match_query() then returns None and callers
+fall back to substring matching.
+"""
+import re
+from itertools import chain
+from sqlalchemy import Float, Integer, bindparam, event, text
+from sqlalchemy.orm import Session
+from models import db, Equipment, EquipmentParameter
+
+SEARCH_TABLE = 'equipment_search'
+
+# Longer queries are cut to this many terms.
+MAX_TERMS = 10
+REINDEX_CHUNK_SIZE = 5000
+
+_CREATE = {
+    'sqlite': [
+        # Prefix indexes make the "term*" queries the search box sends cheap.
+        "CREATE VIRTUAL TABLE IF NOT EXISTS equipment_search USING fts5("
+        "name, codes, make, parameters, description, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    ],
+    'postgresql': [
+        "CREATE TABLE IF NOT EXISTS equipment_search ("
+        "equipment_id INTEGER PRIMARY KEY, document TSVECTOR NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_equipment_search_document ON equipment_search USING GIN (document)",
+    ],
+}
+
+_DELETE = {
+    'sqlite': "DELETE FROM equipment_search WHERE rowid IN :ids",
+    'postgresql': "DELETE FROM equipment_search WHERE equipment_id IN :ids",
+}
+
+_INSERT = {
+    'sqlite': """
+        INSERT INTO equipment_search (rowid, name, codes, make, parameters, description)
+        SELECT e.id,
+               e.name,
+               coalesce(e.new_id_number, '') || ' ' || coalesce(e.serial_number, ''),
+               coalesce(e.manufacturer, '') || ' ' || coalesce(e.model, ''),
+               coalesce((SELECT group_concat(p.parameter_name || ' ' || p.parameter_value, ' ')
+                         FROM equipment_parameter p WHERE p.equipment_id = e.id), ''),
+               coalesce(e.description, '')
+        FROM equipment e
+    """,
+    'postgresql': """
+        INSERT INTO equipment_search (equipment_id, document)
+        SELECT e.id,
+               setweight(to_tsvector('simple', e.name || ' ' || coalesce(e.new_id_number, '')
+                                               || ' ' || coalesce(e.serial_number, '')), 'A')
+               || setweight(to_tsvector('simple', coalesce(e.manufacturer, '') || ' ' || coalesce(e.model, '')), 'B')
+               || setweight(to_tsvector('simple', coalesce((
+                      SELECT string_agg(p.parameter_name || ' ' || p.parameter_value, ' ')
+                      FROM equipment_parameter p WHERE p.equipment_id = e.id), '')), 'C')
+               || setweight(to_tsvector('simple', coalesce(e.description, '')), 'D')
+        FROM equipment e
+    """,
+}
+
+# Both return (equipment_id, rank) with higher ranks first.
+_MATCH = {
+    # bm25() is lower for better matches; the weights follow the column order.
+    'sqlite': "SELECT rowid AS equipment_id, -bm25(equipment_search, 10.0, 10.0, 4.0, 2.0, 1.0) AS rank "
+              "FROM equipment_search WHERE equipment_search MATCH :query",
+    'postgresql': "SELECT equipment_id, ts_rank_cd(document, to_tsquery('simple', :query)) AS rank "
+                  "FROM equipment_search WHERE document @@ to_tsquery('simple', :query)",
+}
+
+
+def backend(bind):
+    name = bind.dialect.name
+    return name if name in _CREATE else None
+
+
+def _terms(search):
+    return re.findall(r'\w+', search.lower())[:MAX_TERMS]
+
+
+def match_query(search):
+    """Subquery of (equipment_id, rank) for equipment matching every term of `search` as a prefix.
+
+    Returns None when the database has no search index or `search` has no terms.
+    """
+    dialect = backend(db.session.get_bind())
+    terms = _terms(search)
+    if dialect is None or not terms:
+        return None
+    if dialect == 'sqlite':
+        query = ' '.join(f'"{term}"*' for term in terms)
+    else:
+        query = ' & '.join(f'{term}:*' for term in terms)
+    return (
+        text(_MATCH[dialect])
+        .bindparams(query=query)
+        .columns(equipment_id=Integer, rank=Float)
+        .subquery('matches')
+    )
+
+
+def create_search_table(connection):
+    dialect = backend(connection)
+    for statement in _CREATE.get(dialect, ()):
+        connection.execute(text(statement))
+
+
+def drop_search_table(connection):
+    if backend(connection) is not None:
+        connection.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+
+
+def reindex_equipment(connection, equipment_ids=None):
+    """Rebuilds the search rows of `equipment_ids` (all equipment when None) on `connection`."""
+    dialect = backend(connection)
+    if dialect is None:
+        return
+    if equipment_ids is None:
+        connection.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+        connection.execute(text(_INSERT[dialect]))
+        return
+
+    equipment_ids = sorted(set(equipment_ids))
+    delete = text(_DELETE[dialect]).bindparams(bindparam('ids', expanding=True))
+    insert = text(_INSERT[dialect] + " WHERE e.id IN :ids").bindparams(bindparam('ids', expanding=True))
+    for start in range(0, len(equipment_ids), REINDEX_CHUNK_SIZE):
+        chunk = equipment_ids[start:start + REINDEX_CHUNK_SIZE]
+        connection.execute(delete, {"ids": chunk})
+        connection.execute(insert, {"ids": chunk})
+
+
+@event.listens_for(Session, 'after_flush')
+def reindex_after_flush(session, flush_context):
+    equipment_ids = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Equipment):
+            equipment_ids.add(obj.id)
+        elif isinstance(obj, EquipmentParameter):
+            equipment_ids.add(obj.equipment_id)
+    equipment_ids.discard(None)
+    if equipment_ids:
+        reindex_equipment(session.connection(), equipment_ids)
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    """Keeps Alembic autogenerate away from the search table (and FTS5's shadow tables)."""
+    return not (type_ == 'table' and reflected and compare_to is None and name.startswith(SEARCH_TABLE))
+
+
+# db.create_all()/drop_all() manage the search table along with the models.
+@event.listens_for(db.metadata, 'after_create')
+def create_search_table_with_models(target, connection, **kw):
+    create_search_table(connection)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_search_table_with_models(target, connection, **kw):
+    drop_search_table(connection)
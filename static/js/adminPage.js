@@ -25,16 +25,18 @@ function getRoleClass(role) {
 // --- Data Fetching ---
 async function fetchData() {
     try {
-        const [usersResponse, unitsResponse] = await Promise.all([
+        const [usersResponse, unitsResponse, summaryResponse] = await Promise.all([
             fetch('/api/admin/users'),
-            fetch('/api/units')
+            fetch('/api/units'),
+            fetch('/api/summary')
         ]);
-        if (!usersResponse.ok || !unitsResponse.ok) throw new Error('Failed to fetch data.');
+        if (!usersResponse.ok || !unitsResponse.ok || !summaryResponse.ok) throw new Error('Failed to fetch data.');
         
         allUsers = await usersResponse.json();
         allUnits = await unitsResponse.json();
+        const summary = await summaryResponse.json();
         
-        updateUserCounts();
+        updateUserCounts(summary.users);
         renderUsersTable();
     } catch (error) {
         console.error("Fetch Error:", error);
@@ -43,13 +45,10 @@ async function fetchData() {
 }
 
 // --- UI Rendering ---
-function updateUserCounts() {
-    const userCount = allUsers.filter(u => u.roles === 'user').length;
-    const adminCount = allUsers.filter(u => u.roles === 'admin').length;
-    const houCount = allUsers.filter(u => u.roles === 'hou').length;
-    
-    document.getElementById('normal-users-count').textContent = userCount + houCount; // HOUs are also users
-    document.getElementById('admins-count').textContent = adminCount;
+// Role counts come from /api/summary, counted by the database
+function updateUserCounts(roleCounts) {
+    document.getElementById('normal-users-count').textContent = roleCounts.user + roleCounts.hou; // HOUs are also users
+    document.getElementById('admins-count').textContent = roleCounts.admin;
 }
 
 function renderUsersTable(usersToRender = allUsers) {
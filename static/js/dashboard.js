@@ -1,10 +1,25 @@
-// Global variable to store all equipment data
-let allEquipmentData = [];
+// Page size requested from /api/equipments
+const PAGE_SIZE = 50;
+
+// Rows loaded so far for the current filters, and where the next page starts
+let loadedEquipmentData = [];
+let nextCursor = null;
+let totalEquipment = 0;
+let latestRequestId = 0;
+let searchDebounceTimer = null;
+// Status counts per branch/unit from /api/summary
+let summaryData = null;
+// Equipment ticked for bulk calibrate/maintain; kept across filter changes and pages
+const selectedIds = new Set();
+const csrfToken = document.querySelector('input[name="csrf_token"]').value;
 
 // Create table row
 function createTableRow(item, index) {
     return `
         <tr class="fade-in">
+            <td class="select-column">
+                <input type="checkbox" class="row-select" value="${item.id}" ${selectedIds.has(item.id) ? 'checked' : ''}>
+            </td>
             <td class="sn-column">${String(index + 1).padStart(2, '0')}</td>
             <td class="name-column">${item.name}</td>
             <td class="location-column">${item.branch_name}</td>
@@ -26,7 +41,7 @@ function openDetails(equipmentId) {
     window.location.href = `/equipments/${equipmentId}`;
 }
 
-function getcal_statusBadge(cal_status) {
+function getcal_statusBadge(cal_status, label) {
     const cal_statusMap = {
         'OK': { class: 'cal_status-active', text: 'OK' },
         'Due Soon': { class: 'cal_status-warning', text: 'Due Soon' },
@@ -34,7 +49,7 @@ function getcal_statusBadge(cal_status) {
         'Unknown': { class: 'cal_status-unknown', text: 'Unknown' }
     };
     const cal_statusInfo = cal_statusMap[cal_status] || cal_statusMap['Unknown'];
-    return `<span class="cal_status-badge ${cal_statusInfo.class}">${cal_statusInfo.text}</span>`;
+    return `<span class="cal_status-badge ${cal_statusInfo.class}">${label || cal_statusInfo.text}</span>`;
 }
 
 function formatDate(dateString) {
@@ -58,54 +73,41 @@ function createEmptyState() {
     `;
 }
 
-// Filter and search function
-function filterAndSearchEquipment() {
-    const searchTerm = document.getElementById('search-input').value.toLowerCase();
+// Build the query string for /api/equipments from the current filter values
+function buildEquipmentQuery(cursor) {
+    // No sort: the server orders by name, or by relevance when searching
+    const params = new URLSearchParams({ limit: PAGE_SIZE });
+    const searchTerm = document.getElementById('search-input').value.trim();
     const statusFilter = document.getElementById('status-filter').value;
     const branchFilter = document.getElementById('branch-filter').value;
     const unitFilter = document.getElementById('unit-filter').value;
 
-    let filteredData = allEquipmentData;
-
-    // Apply search filter
-    if (searchTerm) {
-        filteredData = filteredData.filter(item => 
-            item.name.toLowerCase().includes(searchTerm) ||
-            item.branch_name.toLowerCase().includes(searchTerm) ||
-            item.serial_number.toLowerCase().includes(searchTerm)
-        );
-    }
-
-    // Apply status filter
-    if (statusFilter && statusFilter !== 'all') {
-        filteredData = filteredData.filter(item => item.cal_status === statusFilter);
-    }
+    if (searchTerm) params.set('q', searchTerm);
+    if (statusFilter && statusFilter !== 'all') params.set('cal_status', statusFilter);
+    if (branchFilter && branchFilter !== 'all') params.set('branch_id', branchFilter);
+    if (unitFilter && unitFilter !== 'all') params.set('unit_id', unitFilter);
+    if (cursor) params.set('cursor', cursor);
 
-    // Apply Branch filter
-    if (branchFilter && branchFilter !== 'all') {
-        filteredData = filteredData.filter(item => item.branch_id == branchFilter);
-    }
-
-    // Apply Unit filter
-    if (unitFilter && unitFilter !== 'all') {
-        filteredData = filteredData.filter(item => item.unit_id == unitFilter);
-    }
+    return params.toString();
+}
 
-    // Update the table with filtered data
-    updateTable(filteredData);
-    
-    // Update results count
-    updateResultsCount(filteredData.length, allEquipmentData.length);
+// Filter and search function: the server does the filtering, we just restart from page one
+function filterAndSearchEquipment() {
+    loadedEquipmentData = [];
+    nextCursor = null;
+    totalEquipment = 0;
+    updateStatusSummary();
+    fetchEquipmentPage();
 }
 
-// Update table with filtered data
+// Update table with the rows loaded so far
 function updateTable(data) {
     const tableBody = document.getElementById('table-body');
     
     if (data.length === 0) {
         tableBody.innerHTML = `
             <tr>
-                <td colspan="6">${createEmptyState()}</td>
+                <td colspan="7">${createEmptyState()}</td>
             </tr>
         `;
         return;
@@ -124,40 +126,109 @@ function updateResultsCount(filtered, total) {
     }
 }
 
-function populateFilters() {
-    // Populate Branches
-    const branches = [...new Map(allEquipmentData.map(item => [item.branch_id, {id: item.branch_id, name: item.branch_name}])).values()];
-    const branchFilter = document.getElementById('branch-filter');
-    branchFilter.innerHTML = '<option value="all">All Branches</option>';
-    branches.forEach(branch => {
-        const option = document.createElement('option');
-        option.value = branch.id;
-        option.textContent = branch.name;
-        branchFilter.appendChild(option);
-    });
+// Show calibration status counts for the selected branch or unit
+function updateStatusSummary() {
+    const summaryElement = document.getElementById('status-summary');
+    if (!summaryElement || !summaryData) return;
 
-    // Initially populate all units
-    handleBranchChange();
+    const branchFilter = document.getElementById('branch-filter').value;
+    const unitFilter = document.getElementById('unit-filter').value;
+    let scope = summaryData;
+    if (unitFilter && unitFilter !== 'all') {
+        scope = summaryData.by_unit.find(unit => String(unit.unit_id) === unitFilter);
+    } else if (branchFilter && branchFilter !== 'all') {
+        scope = summaryData.by_branch.find(branch => String(branch.branch_id) === branchFilter);
+    }
+
+    if (!scope) {
+        summaryElement.innerHTML = '';
+        return;
+    }
+    summaryElement.innerHTML = ['OK', 'Due Soon', 'Over Due', 'Unknown']
+        .map(status => getcal_statusBadge(status, `${status}: ${scope.calibration[status]}`))
+        .join('');
+}
+
+function fetchSummary() {
+    fetch('/api/summary')
+        .then(response => response.json())
+        .then(data => {
+            summaryData = data;
+            updateStatusSummary();
+        })
+        .catch(error => console.error('Error fetching summary:', error));
+}
+
+// Show the bulk action bar while anything is selected
+function updateSelection() {
+    const bulkActions = document.getElementById('bulk-actions');
+    document.getElementById('selected-count').textContent = `${selectedIds.size} selected`;
+    bulkActions.style.display = selectedIds.size ? 'flex' : 'none';
+
+    const selectAll = document.getElementById('select-all');
+    selectAll.checked = loadedEquipmentData.length > 0 &&
+        loadedEquipmentData.every(item => selectedIds.has(item.id));
+}
+
+function clearSelection() {
+    selectedIds.clear();
+    document.querySelectorAll('.row-select').forEach(checkbox => { checkbox.checked = false; });
+    updateSelection();
+}
+
+// Mark every selected equipment as calibrated or maintained in one request
+async function recordBulkService(serviceType) {
+    const endpoint = serviceType === 'calibration' ? '/api/calibrate' : '/api/maintain';
+    const serviceDate = document.getElementById('service-date').value;
+    const body = { ids: Array.from(selectedIds) };
+    if (serviceDate) body.date = serviceDate;
+
+    try {
+        const response = await fetch(endpoint, {
+            method: 'PUT',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': csrfToken
+            },
+            body: JSON.stringify(body)
+        });
+        const data = await response.json();
+        if (!response.ok) {
+            alert(Object.values(data.errors || {}).join('\n') || 'Failed to update the selected equipment.');
+            return;
+        }
+
+        // Not found, or already serviced on or after the submitted date
+        const failed = data.results.filter(result => !result.ok)
+            .map(result => `ID ${result.id}: ${result.error}`);
+        alert(`Updated ${data.updated} equipment.` + (failed.length ? `\n${failed.length} skipped:\n${failed.join('\n')}` : ''));
+        clearSelection();
+        filterAndSearchEquipment();
+        fetchSummary();
+    } catch (error) {
+        console.error('Bulk update failed:', error);
+        alert('Failed to update the selected equipment.');
+    }
+}
+
+function updateLoadMoreButton() {
+    const loadMoreBtn = document.getElementById('load-more');
+    if (loadMoreBtn) {
+        loadMoreBtn.style.display = nextCursor ? 'inline-flex' : 'none';
+    }
 }
 
 function handleBranchChange() {
     const selectedBranchId = document.getElementById('branch-filter').value;
     const unitFilter = document.getElementById('unit-filter');
-    
-    // Get all unique units
-    let units = [...new Map(allEquipmentData.map(item => [item.unit_id, {id: item.unit_id, name: item.unit_name, branch_id: item.branch_id}])).values()];
-
-    // Filter units based on the selected branch
-    if (selectedBranchId && selectedBranchId !== 'all') {
-        units = units.filter(unit => unit.branch_id == selectedBranchId);
-    }
+    const unitOptions = document.getElementById('unit-options').content.querySelectorAll('option');
 
     unitFilter.innerHTML = '<option value="all">All Units</option>';
-    units.forEach(unit => {
-        const option = document.createElement('option');
-        option.value = unit.id;
-        option.textContent = unit.name;
-        unitFilter.appendChild(option);
+    unitOptions.forEach(option => {
+        // Only offer units belonging to the selected branch
+        if (selectedBranchId === 'all' || option.dataset.branchId === selectedBranchId) {
+            unitFilter.appendChild(option.cloneNode(true));
+        }
     });
 }
 
@@ -171,22 +242,31 @@ function clearFilters() {
     filterAndSearchEquipment();
 }
 
-// Render table
-function renderTable() {
-    fetch('/api/equipments')
+// Fetch the next page of equipment (or the first page after a filter change)
+function fetchEquipmentPage() {
+    const requestId = ++latestRequestId;
+
+    fetch(`/api/equipments?${buildEquipmentQuery(nextCursor)}`)
         .then(response => response.json())
         .then(data => {
-            allEquipmentData = data;
-            populateFilters(); 
-            updateTable(allEquipmentData);
-            updateResultsCount(allEquipmentData.length, allEquipmentData.length);
+            // Ignore responses for filters the user has already changed
+            if (requestId !== latestRequestId) return;
+
+            loadedEquipmentData = loadedEquipmentData.concat(data.items);
+            nextCursor = data.next_cursor;
+            if (data.total !== null) totalEquipment = data.total;
+
+            updateTable(loadedEquipmentData);
+            updateResultsCount(loadedEquipmentData.length, totalEquipment);
+            updateLoadMoreButton();
+            updateSelection();
         })
         .catch(error => {
             console.error('Error fetching data:', error);
             const tableBody = document.getElementById('table-body');
             tableBody.innerHTML = `
                 <tr>
-                    <td colspan="6" style="text-align: center; padding: 2rem; color: #e74c3c;">
+                    <td colspan="7" style="text-align: center; padding: 2rem; color: #e74c3c;">
                         Error loading equipment data. Please refresh the page.
                     </td>
                 </tr>
@@ -195,7 +275,9 @@ function renderTable() {
 }
 
 document.addEventListener('DOMContentLoaded', function() {
-    renderTable();
+    handleBranchChange();
+    fetchEquipmentPage();
+    fetchSummary();
     
     // Add event listeners for search and filters
     const searchInput = document.getElementById('search-input');
@@ -203,9 +285,14 @@ document.addEventListener('DOMContentLoaded', function() {
     const branchFilter = document.getElementById('branch-filter');
     const unitFilter = document.getElementById('unit-filter');
     const clearBtn = document.getElementById('clear-filters');
+    const loadMoreBtn = document.getElementById('load-more');
 
     if (searchInput) {
-        searchInput.addEventListener('input', filterAndSearchEquipment);
+        searchInput.addEventListener('input', () => {
+            // Wait for the user to stop typing before hitting the server
+            clearTimeout(searchDebounceTimer);
+            searchDebounceTimer = setTimeout(filterAndSearchEquipment, 300);
+        });
     }
 
     if (statusFilter) {
@@ -223,4 +310,37 @@ document.addEventListener('DOMContentLoaded', function() {
     if (clearBtn) {
         clearBtn.addEventListener('click', clearFilters);
     }
+
+    if (loadMoreBtn) {
+        loadMoreBtn.addEventListener('click', fetchEquipmentPage);
+    }
+
+    // Row checkboxes are re-rendered with the table, so listen on the body
+    document.getElementById('table-body').addEventListener('change', event => {
+        if (!event.target.classList.contains('row-select')) return;
+        const equipmentId = Number(event.target.value);
+        if (event.target.checked) {
+            selectedIds.add(equipmentId);
+        } else {
+            selectedIds.delete(equipmentId);
+        }
+        updateSelection();
+    });
+
+    document.getElementById('select-all').addEventListener('change', event => {
+        loadedEquipmentData.forEach(item => {
+            if (event.target.checked) {
+                selectedIds.add(item.id);
+            } else {
+                selectedIds.delete(item.id);
+            }
+        });
+        document.querySelectorAll('.row-select').forEach(checkbox => { checkbox.checked = event.target.checked; });
+        updateSelection();
+    });
+
+    document.getElementById('service-date').max = new Date().toISOString().slice(0, 10);
+    document.getElementById('bulk-calibrate').addEventListener('click', () => recordBulkService('calibration'));
+    document.getElementById('bulk-maintain').addEventListener('click', () => recordBulkService('maintenance'));
+    document.getElementById('clear-selection').addEventListener('click', clearSelection);
 });
\ No newline at end of file
@@ -0,0 +1,76 @@
+"""Short-lived in-process cache behind the Flask-Login user loader.
+
+Every authenticated request used to load its user with a primary-key query.
+The loader now keeps the user's column values, minus the password hash, in
+an LRU keyed by user id. On a hit it attaches them to the current session
+with merge(load=False), which emits no SQL. The result is a normal persistent
+User, so relationships such as `unit` and the password hash still load on
+first access.
+
+Paths that change a user call invalidate(user_id) after committing. Other
+workers see the change once their entry's USER_CACHE_TTL runs out.
+"""
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy.orm import make_transient_to_detached
+from models import db, User
+
+DEFAULT_TTL = 30
+DEFAULT_SIZE = 1024
+
+# Never kept in memory longer than a request needs it.
+EXCLUDED_COLUMNS = {'password_hash'}
+
+_entries = OrderedDict()  # user id -> (cached_at, column values)
+_lock = threading.Lock()
+stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _snapshot(user):
+    return {
+        column.key: getattr(user, column.key)
+        for column in User.__mapper__.column_attrs
+        if column.key not in EXCLUDED_COLUMNS
+    }
+
+
+def load_cached_user(user_id):
+    ttl = current_app.config.get('USER_CACHE_TTL', DEFAULT_TTL)
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry is not None and now - entry[0] < ttl:
+            _entries.move_to_end(user_id)
+            stats["hits"] += 1
+            values = entry[1]
+        else:
+            stats["misses"] += 1
+            values = None
+
+    if values is not None:
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    size = current_app.config.get('USER_CACHE_SIZE', DEFAULT_SIZE)
+    with _lock:
+        _entries[user_id] = (now, _snapshot(user))
+        _entries.move_to_end(user_id)
+        while len(_entries) > size:
+            _entries.popitem(last=False)
+            stats["evictions"] += 1
+    return user
+
+
+def invalidate(user_id=None):
+    """Forgets one user, or everyone when no id is given."""
+    with _lock:
+        if user_id is None:
+            _entries.clear()
+        else:
+            _entries.pop(user_id, None)